@@ -0,0 +1,213 @@
+"""Runs a script of nanosyncs operations over one connection and reports each result as a JSON line
+
+    python Nano_sync_batch.py rehearsal.txt
+    echo 'apply fps="25 fps"' | python Nano_sync_batch.py
+
+One operation per line, # starts a comment
+
+    get                                  the whole config
+    get fps hd_standard                  some settings
+    apply fps="25 fps" hd_standard="720p x2 fps"
+    recall "film 23.98"                  a preset from --presets
+    recall [0, 1, 1, 3, 5, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]
+    wait 2.5                             seconds
+    assert fps="25 fps"                  fails the script if a setting differs
+
+A line can also be a JSON object, eg. {"op": "apply", "fields": {"fps": "25 fps"}}, {"op": "get", "fields": ["fps"]},
+{"op": "recall", "preset": "film 23.98"}, {"op": "recall", "config": [...]}, {"op": "wait", "seconds": 2.5} or
+{"op": "assert", "fields": {"fps": "25 fps"}}.
+
+Consecutive apply lines are merged into a single write. Each result is written to stdout as a JSON object with the
+script line numbers it covers, ok and the outcome; the library's progress messages go to stderr. The run stops at the
+first failure, with exit status 1, unless --keep-going is given
+"""
+import sys
+import json
+import time
+import shlex
+import argparse
+import contextlib
+
+from Nano_sync_control import NanoSync, FIELDS, decode_setting
+
+
+# the keys a JSON operation has to give, recall takes a preset or a config
+OPERATION_KEYS = {"get": (), "apply": ("fields",), "recall": (), "wait": ("seconds",), "assert": ("fields",)}
+
+
+def check_operation(operation):
+    """Raises ValueError if a JSON operation isn't one run_operation can run"""
+
+    if not isinstance(operation, dict):
+        raise ValueError("an operation has to be a JSON object")
+    op = operation.get("op")
+    if op not in OPERATION_KEYS:
+        raise ValueError("unknown operation %r" % op)
+
+    missing = [key for key in OPERATION_KEYS[op] if key not in operation]
+    if op == "recall" and "preset" not in operation and "config" not in operation:
+        missing.append("preset or config")
+    if missing:
+        raise ValueError("%s needs %s" % (op, ", ".join(missing)))
+
+    if op in ("apply", "assert") and not isinstance(operation["fields"], dict):
+        raise ValueError("%s fields have to be an object of field: setting" % op)
+    if op == "get" and not isinstance(operation.get("fields", []), list):
+        raise ValueError("get fields have to be a list of field names")
+    if op == "wait" and (isinstance(operation["seconds"], bool) or not isinstance(operation["seconds"], (int, float))):
+        raise ValueError("wait seconds have to be a number")
+
+
+def parse_operation(line):
+    """Returns the operation on a script line as a dict, None for a blank line or a comment
+
+    raises ValueError if the line isn't a valid operation"""
+
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if line.startswith("{"):
+        operation = json.loads(line)
+        check_operation(operation)
+        return operation
+
+    op, _, rest = line.partition(" ")
+    rest = rest.strip()
+    if op == "recall" and rest.startswith("["):
+        return {"op": op, "config": json.loads(rest)}
+
+    words = shlex.split(rest, comments=True)
+    if op in ("apply", "assert"):
+        fields = {}
+        for word in words:
+            field, separator, setting = word.partition("=")
+            if not separator:
+                raise ValueError("expected field=setting, got %r" % word)
+            fields[field] = setting
+        return {"op": op, "fields": fields}
+    if op == "get":
+        return {"op": op, "fields": words}
+    if op == "recall":
+        return {"op": op, "preset": " ".join(words)}
+    if op == "wait":
+        return {"op": op, "seconds": float(rest)}
+    raise ValueError("unknown operation %r" % op)
+
+
+def read_script(lines):
+    """Yields (line numbers, operation) with consecutive applies merged into one operation"""
+
+    merged_lines, merged_fields = [], {}
+    for number, line in enumerate(lines, 1):
+        try:
+            operation = parse_operation(line)
+        except ValueError as error:
+            operation = {"op": "invalid", "error": str(error)}
+        if operation is None:
+            continue
+
+        if operation["op"] == "apply":
+            merged_lines.append(number)
+            merged_fields.update(operation["fields"])
+            continue
+        if merged_lines:
+            yield merged_lines, {"op": "apply", "fields": merged_fields}
+            merged_lines, merged_fields = [], {}
+        yield [number], operation
+
+    if merged_lines:
+        yield merged_lines, {"op": "apply", "fields": merged_fields}
+
+
+def _labels(config, fields=None):
+    return {field: decode_setting(field, config[FIELDS[field].offset]) for field in fields or FIELDS}
+
+
+def run_operation(nanosync, operation, presets=None):
+    """Runs one operation, returns a dict with ok and the outcome"""
+
+    op = operation.get("op")
+    if op == "get":
+        return {"ok": True, "config": _labels(nanosync.get_config(), operation.get("fields"))}
+    if op == "apply":
+        nanosync.apply(**operation["fields"])
+        return {"ok": True, "fields": operation["fields"], "config": _labels(nanosync.config)}
+    if op == "recall":
+        if "preset" in operation:
+            if presets is None:
+                raise ValueError("recalling a preset needs --presets")
+            config = presets.recall(nanosync, operation["preset"])
+        else:
+            config = nanosync.recall(operation["config"])
+        return {"ok": True, "config": _labels(config)}
+    if op == "wait":
+        time.sleep(operation["seconds"])
+        return {"ok": True}
+    if op == "assert":
+        actual = _labels(nanosync.get_config(), operation["fields"])
+        return {"ok": actual == operation["fields"], "expected": operation["fields"], "actual": actual}
+    if op == "invalid":
+        raise ValueError(operation["error"])
+    raise ValueError("unknown operation %r" % op)
+
+
+def run(nanosync, lines, output, presets=None, keep_going=False):
+    """Runs a script against a connected NanoSync, writing a JSON line per result, returns True if all succeeded"""
+
+    succeeded = True
+    for numbers, operation in read_script(lines):
+        start = time.perf_counter()
+        try:
+            result = run_operation(nanosync, operation, presets)
+        except (ValueError, KeyError, TypeError, IOError) as error:
+            result = {"ok": False, "error": "%s: %s" % (type(error).__name__, error)}
+
+        report = {"lines": numbers, "op": operation.get("op")}
+        report.update(result)
+        report["seconds"] = time.perf_counter() - start
+        output.write(json.dumps(report) + "\n")
+        output.flush()
+
+        if not result["ok"]:
+            succeeded = False
+            if not keep_going:
+                break
+    return succeeded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("script", nargs="?", help="file of operations, stdin if not given")
+    parser.add_argument("--presets", help="preset file for recall, see Nano_sync_presets.py")
+    parser.add_argument("--keep-going", action="store_true", help="carry on after a failed operation")
+    parser.add_argument("--timeout", type=float, default=0.5, help="seconds to wait for each reply")
+    parser.add_argument("--max-age", type=float, default=0.0,
+                        help="seconds a config read from the unit is used for get and assert without asking again")
+    parser.add_argument("--emulate", action="store_true", help="run against an emulated nanosyncs")
+    args = parser.parse_args(argv)
+
+    presets = None
+    if args.presets:
+        from Nano_sync_presets import PresetStore
+        presets = PresetStore(args.presets)
+
+    output = sys.stdout
+    script = open(args.script) if args.script else contextlib.nullcontext(sys.stdin)
+    # the library reports progress with print, keep stdout for the results
+    with script as lines, contextlib.redirect_stdout(sys.stderr):
+        transport = None
+        if args.emulate:
+            from Nano_sync_emulator import EmulatedTransport
+            transport = EmulatedTransport()
+
+        nanosync = NanoSync(timeout=args.timeout, max_age=args.max_age, transport=transport)
+        try:
+            succeeded = run(nanosync, lines, output, presets, args.keep_going)
+        finally:
+            nanosync.disconnect()
+
+    sys.exit(0 if succeeded else 1)
+
+
+if __name__ == "__main__":
+    main()
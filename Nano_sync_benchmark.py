@@ -0,0 +1,195 @@
+"""Latency and throughput benchmarks for the nanosyncs control protocol
+
+Runs against an emulated nanosyncs by default, or a real unit with --hardware, and writes the results as JSON so runs
+can be compared when the receive path or retry logic changes
+
+    python Nano_sync_benchmark.py --latency 0.002 --jitter 0.001 --output results.json
+    python Nano_sync_benchmark.py --hardware
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+import threading
+import contextlib
+
+from Nano_sync_control import NanoSync, NanoSyncMetrics
+
+
+def summarise(samples, errors=0):
+    """Returns count, error count, mean and percentiles in milliseconds for a list of durations in seconds"""
+
+    result = {"count": len(samples), "errors": errors}
+    if not samples:
+        return result
+
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    result.update({
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": percentile(0.50),
+        "p90_ms": percentile(0.90),
+        "p99_ms": percentile(0.99),
+        "max_ms": ordered[-1] * 1000})
+    return result
+
+
+def _timed(function, iterations):
+    """Calls function(i) iterations times, returns the summary of the calls that did not raise an IOError"""
+
+    samples = []
+    errors = 0
+    for i in range(iterations):
+        start = time.perf_counter()
+        try:
+            function(i)
+        except IOError:
+            errors += 1
+            continue
+        samples.append(time.perf_counter() - start)
+    return summarise(samples, errors)
+
+
+def _with_retries(function, attempts=5):
+    """Calls function() for a setup or teardown exchange, retrying when it raises an IOError, eg. a reply lost with
+    --drop-rate, so one lost reply doesn't abort the run"""
+
+    for attempt in range(attempts - 1):
+        try:
+            return function()
+        except IOError:
+            pass
+    return function()
+
+
+def bench_query(nanosync, iterations):
+    """Round trip of a config query"""
+    return _timed(lambda i: nanosync.get_config(force=True), iterations)
+
+
+def bench_write(nanosync, iterations):
+    """send_new_config_raw - query, write and verify"""
+    config = _with_retries(lambda: nanosync.get_config(force=True))
+    # the FPS byte is toggled between 25 and 30 fps so that every write is a real change
+    configs = [config.replace(fps=3), config.replace(fps=5)]
+    return _timed(lambda i: nanosync.send_new_config_raw(configs[i % 2]), iterations)
+
+
+def bench_setter(nanosync, iterations):
+    """A single set_* call"""
+    return _timed(lambda i: nanosync.set_fps("25 fps" if i % 2 == 0 else "30 fps"), iterations)
+
+
+def bench_config_change(nanosync, iterations):
+    """Changing the format and the frame rate together"""
+
+    changes = [{"hd_standard": "720p x2 fps", "fps": "25 fps"}, {"hd_standard": "1080p x2 fps", "fps": "30 fps"}]
+    return _timed(lambda i: nanosync.apply(**changes[i % 2]), iterations)
+
+
+def bench_concurrent(nanosync, callers, duration):
+    """Config queries from several threads sharing one NanoSync for duration seconds"""
+
+    samples = []
+    errors = [0]
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def caller():
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                nanosync.get_config(force=True)
+            except IOError:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                samples.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=caller) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result = summarise(samples, errors[0])
+    result["callers"] = callers
+    result["ops_per_second"] = len(samples) / duration
+    return result
+
+
+def run(nanosync, iterations=100, callers=4, duration=2.0):
+    """Runs every benchmark against a connected NanoSync and returns the results as a dict"""
+
+    original = _with_retries(lambda: nanosync.get_config(force=True))
+    try:
+        return {
+            "query": bench_query(nanosync, iterations),
+            "write_and_verify": bench_write(nanosync, iterations),
+            "setter": bench_setter(nanosync, iterations),
+            "config_change": bench_config_change(nanosync, iterations),
+            "concurrent_query": bench_concurrent(nanosync, callers, duration)}
+    finally:
+        # leave the unit as it was found, a failure here is reported without losing the results
+        try:
+            _with_retries(lambda: nanosync.send_new_config_raw(original))
+        except IOError as error:
+            print("unable to restore the config the nanosyncs was found with: %s" % error)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hardware", action="store_true", help="benchmark the first connected nanosyncs")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--callers", type=int, default=4, help="threads used for the concurrent benchmark")
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds the concurrent benchmark runs for")
+    parser.add_argument("--timeout", type=float, default=0.5, help="seconds to wait for each reply")
+    parser.add_argument("--latency", type=float, default=0.002, help="emulated reply latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="emulated reply jitter in seconds")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of emulated replies that are lost")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="file to write the JSON results to, stdout if not given")
+    args = parser.parse_args(argv)
+
+    # counts the retries, timeouts and verify mismatches behind the numbers
+    metrics = NanoSyncMetrics()
+
+    # the library reports progress with print, keep stdout for the results
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.hardware:
+            nanosync = NanoSync(timeout=args.timeout, metrics=metrics)
+        else:
+            from Nano_sync_emulator import EmulatedNanoSync, EmulatedTransport
+
+            device = EmulatedNanoSync(latency=args.latency, jitter=args.jitter, seed=args.seed)
+            nanosync = NanoSync(timeout=args.timeout, transport=EmulatedTransport([device]), metrics=metrics)
+            device.drop_rate = args.drop_rate  # only once connected so the handshake can't be lost
+
+        try:
+            results = run(nanosync, args.iterations, args.callers, args.duration)
+        finally:
+            nanosync.disconnect()
+
+    report = {
+        "target": "hardware" if args.hardware else "emulator",
+        "settings": vars(args),
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+        "results": results,
+        "metrics": metrics.snapshot()}
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Recording of the system exclusive traffic between NanoSync and a nanosyncs, and replay of recorded sessions
+
+    sync = NanoSync(transport=RecordingTransport(MidiTransport(), "show.nslog"))   # records every frame
+    sync = NanoSync(transport=ReplayTransport("show.nslog", time_scale=0))        # plays the session back
+
+A capture file starts with the 5 byte header NSYX 01 followed by one record per frame: the wall clock time as a
+little endian double, 0 for a frame sent to the unit or 1 for a frame received from it, the frame length as an
+unsigned short and then the frame itself. Records are only ever appended so a file can be read while it is written.
+
+    python Nano_sync_capture.py show.nslog    # prints a recorded session
+"""
+import time
+import mmap
+import struct
+import argparse
+import threading
+from collections import namedtuple
+
+from Nano_sync_control import Transport, MidiTransport
+from Nano_sync_emulator import EmulatedTransport
+
+CAPTURE_HEADER = b"NSYX\x01"
+_RECORD = struct.Struct("<dBH")   # time, direction, frame length
+
+SENT = 0       # host to nanosyncs
+RECEIVED = 1   # nanosyncs to host
+
+CapturedFrame = namedtuple("CapturedFrame", "time direction frame")
+
+
+class CaptureWriter:
+    """Appends timestamped frames to a capture file, safe to use from the sending and the callback threads at once"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(CAPTURE_HEADER)
+        self._lock = threading.Lock()
+
+    def write(self, direction, frame):
+        record = _RECORD.pack(time.time(), direction, len(frame)) + bytes(frame)
+        with self._lock:
+            self._file.write(record)
+            self._file.flush()  # a crash or a pulled cable is when the capture is needed most
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path):
+    """Yields the CapturedFrame records of a capture file in the order they were written
+
+    The file is memory mapped rather than read, so long captures can be scanned without loading them. A record cut
+    short by a crash while it was written ends the capture"""
+
+    with open(path, "rb") as file:
+        if file.read(len(CAPTURE_HEADER)) != CAPTURE_HEADER:
+            raise ValueError("%s is not a nanosyncs capture file" % path)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset = len(CAPTURE_HEADER)
+            while offset + _RECORD.size <= len(data):
+                timestamp, direction, length = _RECORD.unpack_from(data, offset)
+                offset += _RECORD.size
+                if offset + length > len(data):
+                    return
+                yield CapturedFrame(timestamp, direction, data[offset:offset + length])
+                offset += length
+
+
+class RecordingTransport(Transport):
+    """Passes frames to and from another transport and records every one of them to a capture file
+
+    Each time the transport is opened, eg. when NanoSync reconnects, the session is appended to the same file"""
+
+    def __init__(self, transport=None, path="nanosync.nslog"):
+        self.transport = transport if transport is not None else MidiTransport()
+        self.path = path
+        self._writer = None
+
+    def list_ports(self):
+        return self.transport.list_ports()
+
+    def open(self, in_port, out_port, callback):
+        writer = self._writer = CaptureWriter(self.path)
+
+        def record(frame):
+            writer.write(RECEIVED, frame)
+            callback(frame)
+
+        try:
+            self.transport.open(in_port, out_port, record)
+        except Exception:
+            writer.close()
+            raise
+
+    def send_frame(self, frame):
+        self._writer.write(SENT, frame)
+        self.transport.send_frame(frame)
+
+    def close(self):
+        self.transport.close()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class ReplayTransport(EmulatedTransport):
+    """Plays a recorded session back to NanoSync, which sees the same replies at the same times as when it was recorded
+
+    Every frame NanoSync sends is matched to the next frame sent in the capture and the frames received after it in the
+    capture are delivered with their recorded delay multiplied by time_scale - 1 for the original timing, 0 for as fast
+    as possible. With strict a frame that differs from the recorded one raises an IOError, so changes to the control
+    logic show up as a divergence from the recorded session. Sending past the end of the capture raises an IOError"""
+
+    def __init__(self, capture, time_scale=1.0, strict=True):
+        super().__init__(devices=[])
+
+        # a path or any iterable of CapturedFrame, eg. a list filtered from read_capture
+        self.frames = list(read_capture(capture) if isinstance(capture, str) else capture)
+        self.time_scale = time_scale
+        self.strict = strict
+        self._position = 0
+
+    def list_ports(self):
+        return ["NANOSYNCS 1"], ["NANOSYNCS 1"]
+
+    def open(self, in_port, out_port, callback):
+        self._callback = callback
+        self._closed = False
+        self._position = 0
+        self._thread = threading.Thread(target=self._deliver, name="nanosyncs replay", daemon=True)
+        self._thread.start()
+
+        # frames the unit sent before the first request, eg. while it was being watched
+        self._replay_received(self.frames[0].time if self.frames else 0.0)
+
+    def send_frame(self, frame):
+        while self._position < len(self.frames) and self.frames[self._position].direction != SENT:
+            self._position += 1
+        if self._position == len(self.frames):
+            raise IOError("sent a frame past the end of the capture")
+
+        recorded = self.frames[self._position]
+        if self.strict and bytes(frame) != bytes(recorded.frame):
+            raise IOError("replay diverged at frame %i, sent %s where the capture has %s"
+                          % (self._position, bytes(frame).hex(" "), bytes(recorded.frame).hex(" ")))
+        self._position += 1
+        self._replay_received(recorded.time)
+
+    def _replay_received(self, since):
+        """Queues the received frames up to the next sent one, delayed by their recorded time after since"""
+
+        while self._position < len(self.frames) and self.frames[self._position].direction == RECEIVED:
+            captured = self.frames[self._position]
+            self._schedule(max(0.0, captured.time - since) * self.time_scale, list(captured.frame))
+            self._position += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="prints the frames of a nanosyncs capture file")
+    parser.add_argument("capture")
+    args = parser.parse_args(argv)
+
+    start = None
+    for captured in read_capture(args.capture):
+        if start is None:
+            start = captured.time
+        print("%10.4f %s %s" % (captured.time - start, "->" if captured.direction == SENT else "<-",
+                                bytes(captured.frame).hex(" ")))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,577 +1,2077 @@
 import time
-import rtmidi
-from bidict import bidict
-from collections import namedtuple
+import threading
+from abc import ABC, abstractmethod
+from operator import contains
+from fractions import Fraction
+from types import MappingProxyType
+from bidict import frozenbidict
+from collections import namedtuple, deque
+
+# asyncio and concurrent.futures are imported where they are used so that code paths which never talk to the device,
+# eg. only using the settings tables or an offline config, start quickly. rtmidi is imported by MidiTransport
+
+SYSEX_HEADER = [240, 44, 78, 83]  # F0 2C 4E 53 - every message to and from the nanosyncs starts with this
+SYSEX_FOOTER = [247]              # F7
+
+# fixed frames are built once
+SERIAL_QUERY_FRAME = bytes(SYSEX_HEADER + [1] + SYSEX_FOOTER)  # F0 2C 4E 53 01 F7 - returns S/N and firmware version
+CONFIG_QUERY_FRAME = bytes(SYSEX_HEADER + [3] + SYSEX_FOOTER)  # F0 2C 4E 53 03 F7 - returns the current config
+_CONFIG_WRITE_HEADER = bytes(SYSEX_HEADER + [15])             # F0 2C 4E 53 0F - followed by the 20 config bytes
+_FOOTER = bytes(SYSEX_FOOTER)
+
+# <editor-fold desc="Settings tables">
+# label -> config byte, shared by every NanoSync and never modified
+SETTING_TABLES = MappingProxyType({
+    "video_ref":                    frozenbidict({"internal": 1, "external pal": 2, "external ntsc": 3, "external tri": 4}),
+    "video_standard":               frozenbidict({"ntsc": 1, "pal 25": 2, "pal 24": 3, "pal 23.98": 4}),
+    "HD_standard":                  frozenbidict({"1080i x2 fps": 1, "1080p x1 fps": 2, "1080p x2 fps": 3, "720p x1 fps": 4, "720p x2 fps": 5}),
+    "FPS":                          frozenbidict({"23.98 fps": 1, "24 fps": 2, "25 fps": 3, "29.97 fps": 4, "30 fps": 5}),
+    "video_definition":             frozenbidict({"SD" : 1, "HD": 2}),
+
+    "audio_ref":                    frozenbidict({"follow video": 1, "external word clock": 2, "external word 1:1": 3, "LTC": 4}),
+    "external_word_fs":             frozenbidict({"44.1 khz": 1, "48 khz": 2}),
+    "external_word_fs_multiplier":  frozenbidict({"x1": 1, "x2": 2}),
+    "external_word_fs_modifier":    frozenbidict({"1/1": 1, "+0.1%": 2}),
+    "external_LTC_fps":             frozenbidict({"23.98 fps": 1, " 24 fps": 2, "25 fps": 3, "29.98 fps": 4, "30 fps": 5}),
+    "audio_sample_rate":            frozenbidict({"48 khz": 1, "44.1 khz": 2}),
+    "audio_sample_rate_modifier":   frozenbidict({"x1": 1, "+4%": 2, "+0.1%": 3, "-0.1%": 4, "-4%": 5}),
+    "word_multiplier_1_6":          frozenbidict({"x1": 1, "x2": 2, "x4": 3}),
+    "word_multiplier_7_8":          frozenbidict({"x1": 1, "x2": 2, "x4": 3, "x256": 4}),
+    "AES_multiplier":               frozenbidict({"x1": 1, "x2": 2}),
+    "SPDIF_multiplier":             frozenbidict({"x1": 1, "x2": 2}),
+})
+# </editor-fold>
+
+# One entry per setting byte. name is the keyword used by apply() and the set_<name> setter, offset the position in the
+# 20 byte config, table the label <-> byte lookup, attribute and getter the older per setting names on NanoSync,
+# description the text used by print_current_config and default the label a fresh NanoSync starts with
+SettingField = namedtuple("SettingField", "name offset table attribute getter description default")
+
+_FIELD_ROWS = [
+    # name                          table                           attribute                               getter                                  description                 default
+    ("video_ref",                   "video_ref",                    "video_ref_setting",                    "get_video_ref",                        "video ref",                "internal"),
+    ("video_standard",              "video_standard",               "video_standard_setting",               "get_video_standard",                   "video standard",           "ntsc"),
+    ("hd_standard",                 "HD_standard",                  "HD_standard_setting",                  "get_hd_standard",                      "HD standard",              "1080p x2 fps"),
+    ("fps",                         "FPS",                          "FPS_setting",                          "get_fps",                              "FPS",                      "30 fps"),
+    ("sdi_out_1_to_3",              "video_definition",             "video_1_to_3_setting",                 "get_sdi_out_1_to_3",                   "SDI out 1 to 3",           "HD"),
+    ("sdi_out_4",                   "video_definition",             "video_4_setting",                      "get_sdi_out_4",                        "SDI out 4",                "HD"),
+    ("sdi_out_5",                   "video_definition",             "video_5_setting",                      "get_sdi_out_5",                        "SDI out 5",                "HD"),
+    ("sdi_out_6",                   "video_definition",             "video_6_setting",                      "get_sdi_out_6",                        "SDI out 6",                "HD"),
+
+    # audio stuff below, best to leave it all alone
+    ("audio_reference",             "audio_ref",                    "audio_ref_setting",                    "get_audio_ref",                        "Audio ref",                "follow video"),
+    ("external_word_fs",            "external_word_fs",             "external_word_fs_setting",             "get_external_word_fs",                 "External word",            "44.1 khz"),
+    ("external_word_multiplier",    "external_word_fs_multiplier",  "external_word_fs_multiplier_setting",  "get_external_word_fs_multiplier",      "External word multiplier", "x1"),
+    ("external_word_modifier",      "external_word_fs_modifier",    "external_word_fs_modifier_setting",    "get_external_word_fs_modifier",        "External word fs 1",       "1/1"),
+    ("external_ltc_fps",            "external_LTC_fps",             "external_LTC_fps_setting",             "get_external_LTC_fps",                 "External LTC fps",         "23.98 fps"),
+    ("audio_sample_rate",           "audio_sample_rate",            "audio_sample_rate_setting",            "get_audio_sample_rate",                "Audio sample rate",        "48 khz"),
+    ("audio_sample_rate_modifier",  "audio_sample_rate_modifier",   "audio_sample_rate_modifier_setting",   "get_audio_sample_rate_modifier",       "Sample rate pull factor",  "x1"),
+    ("word_multiplier_1_6",         "word_multiplier_1_6",          "word_multiplier_1_6_setting",          "get_word_multiplier_1_6",              "word mult 1 to 6",         "x1"),
+    ("word_multiplier_7_8",         "word_multiplier_7_8",          "word_multiplier_7_8_setting",          "get_word_multiplier_7_8",              "word mult 7 to 8",         "x1"),
+    ("AES_multiplier",              "AES_multiplier",               "AES_multiplier_setting",               "get_AES_multiplier",                   "AES mult",                 "x1"),
+    ("SPDIF_multiplier",            "SPDIF_multiplier",             "SPDIF_multiplier_setting",             "get_SPDIF_multiplier",                 "SPDIF mult",               "x1"),
+]
+FIELDS = MappingProxyType({
+    name: SettingField(name, offset, SETTING_TABLES[table], attribute, getter, description, default)
+    for offset, (name, table, attribute, getter, description, default) in enumerate(_FIELD_ROWS, start=1)})
+
+# names of the 20 config bytes in the order they are sent, byte 0 is the cursor position
+CONFIG_FIELDS = ("cursor_pos",) + tuple(FIELDS)
+_CONFIG_OFFSETS = {field: i for i, field in enumerate(CONFIG_FIELDS)}
+
+
+# one changed setting, old and new are the setting labels
+SettingChange = namedtuple("SettingChange", "field old new")
+
+
+# refresh rate of the HD outputs, numerator and denominator are ints and rate the exact Fraction
+RefreshRate = namedtuple("RefreshRate", "numerator denominator rate interlaced")
+
+_FPS_RATES = {"23.98 fps": Fraction(24000, 1001), "24 fps": Fraction(24), "25 fps": Fraction(25),
+              "29.97 fps": Fraction(30000, 1001), "30 fps": Fraction(30)}
+
+
+def _build_refresh_rates():
+    refresh_rates = {}
+    rate_settings = {}
+    for hd_standard, hd_value in SETTING_TABLES["HD_standard"].items():
+        # the "p x2 fps" standards run at twice the frame rate, 1080i and the "x1 fps" ones at the frame rate
+        multiplier = 2 if hd_standard in ("1080p x2 fps", "720p x2 fps") else 1
+        interlaced = hd_standard.startswith("1080i")
+        lines = int(hd_standard[:4].rstrip("ip"))
+        for fps, fps_value in SETTING_TABLES["FPS"].items():
+            rate = _FPS_RATES[fps] * multiplier
+            refresh_rates[(hd_value, fps_value)] = RefreshRate(rate.numerator, rate.denominator, rate, interlaced)
+            # rounded so that 59.94 finds 60000/1001 as well as the exact Fraction
+            rate_settings[(round(float(rate), 2), interlaced, lines)] = (hd_standard, fps)
+    return MappingProxyType(refresh_rates), MappingProxyType(rate_settings)
+
+
+# (HD standard byte, FPS byte) -> RefreshRate for every combination, and (rate, interlaced, lines) -> setting labels
+REFRESH_RATES, _RATE_SETTINGS = _build_refresh_rates()
+
+
+def refresh_rate_settings(rate, interlaced=False, lines=1080):
+    """Returns the (HD standard, FPS) labels that give a refresh rate, eg.
+    refresh_rate_settings(Fraction(60000, 1001)) -> ("1080p x2 fps", "29.97 fps")
+
+    rate can be a Fraction, int or float such as 59.94, lines is 1080 or 720. Raises ValueError if no HD standard gives
+    the rate"""
+
+    key = (round(float(rate), 2), interlaced, lines)
+    if key not in _RATE_SETTINGS:
+        raise ValueError("no %i%s HD standard gives a refresh rate of %s" % (lines, "i" if interlaced else "p", rate))
+    return _RATE_SETTINGS[key]
+
+
+def encode_setting(field, setting):
+    """Returns the config byte for a setting label, eg. encode_setting("fps", "25 fps") -> 3
+
+    Raises ValueError for an unknown field or a label that is not valid for it"""
+
+    if field not in FIELDS:
+        raise ValueError("unknown setting %s" % field)
+    table = FIELDS[field].table
+    if setting not in table:
+        raise ValueError("invalid setting %r has been given for %s, expected one of %s" % (setting, field, list(table)))
+    return table[setting]
 
-class NanoSync:
-    def __init__(self):
 
-        self.serial_number = ""
-        self.firmware_version = ""
+def decode_setting(field, value):
+    """Returns the label for a config byte, eg. decode_setting("fps", 3) -> "25 fps" """
 
-        # create midi objects fot communication
-
-        self.nanosync_midi_out = rtmidi.MidiOut()
-        self.nanosync_midi_in = rtmidi.MidiIn()
-
-        self.midi_in_port = None
-        self.midi_out_port = None
-        self._select_correct_ports()
-
-        # important commands used for NanoSyncs
-        self.serial_message = [1]         # F0 2C 4E 53 01 F7 - command to return S/N of Nano Sync and firmware version
-        self.query_current_Config = [3]   # F0 2C 4E 53 03 F7 - Queries the nano sync about its current setup
-
-        # abstraction for the Nano sync control
-
-        # <editor-fold desc="Settings dictionaries">
-        self.video_ref                          = bidict({"internal": 1, "external pal": 2, "external ntsc": 3, "external tri": 4})
-        self.video_standard                     = bidict({"ntsc": 1, "pal 25": 2, "pal 24": 3, "pal 23.98": 4})
-        self.HD_standard                        = bidict({"1080i x2 fps": 1, "1080p x1 fps": 2, "1080p x2 fps": 3, "720p x1 fps": 4, "720p x2 fps": 5})
-        self.FPS                                = bidict({"23.98 fps": 1, "24 fps": 2, "25 fps": 3, "29.97 fps": 4, "30 fps": 5})
-        self.video_definition                   = bidict({"SD" : 1, "HD": 2})
-
-        self.audio_ref                          = bidict({"follow video": 1, "external word clock": 2, "external word 1:1": 3, "LTC": 4})
-        self.external_word_fs                   = bidict({"44.1 khz": 1, "48 khz": 2})
-        self.external_word_fs_multiplier        = bidict({"x1": 1, "x2": 2})
-        self.external_word_fs_modifier          = bidict({"1/1": 1, "+0.1%": 2})
-        self.external_LTC_fps                   = bidict({"23.98 fps": 1, " 24 fps": 2, "25 fps": 3, "29.98 fps": 4, "30 fps": 5})
-        self.audio_sample_rate                  = bidict({"48 khz": 1, "44.1 khz": 2})
-        self.audio_sample_rate_modifier         = bidict({"x1": 1, "+4%": 2, "+0.1%": 3, "-0.1%": 4, "-4%": 5})
-        self.word_multiplier_1_6                = bidict({"x1": 1, "x2": 2, "x4": 3})
-        self.word_multiplier_7_8                = bidict({"x1": 1, "x2": 2, "x4": 4, "x256": 5})
-        self.AES_multiplier                     = bidict({"x1": 1, "x2": 2})
-        self.SPDIF_multiplier                   = bidict({"x1": 1, "x2": 2})
-        # </editor-fold>
-
-        # Setting some default values
-
-        self.cursor_pos                             = 0 # Placeholder
-        self.video_ref_setting                      = self.video_ref["internal"]
-        self.video_standard_setting                 = self.video_standard["ntsc"]
-        self.HD_standard_setting                    = self.HD_standard["1080p x2 fps"]
-        self.FPS_setting                            = self.FPS["30 fps"]
-        self.video_1_to_3_setting                   = self.video_definition["HD"]
-        self.video_4_setting                        = self.video_definition["HD"]
-        self.video_5_setting                        = self.video_definition["HD"]
-        self.video_6_setting                        = self.video_definition["HD"]
-
-        # audio stuff below, best to leave it all alone
-        self.audio_ref_setting                      = self.audio_ref["follow video"]
-        self.external_word_fs_setting               = self.external_word_fs["44.1 khz"]
-        self.external_word_fs_multiplier_setting    = self.external_word_fs_multiplier["x1"]
-        self.external_word_fs_modifier_setting      = self.external_word_fs_modifier["1/1"]
-        self.external_LTC_fps_setting               = self.external_LTC_fps["23.98 fps"]
-        self.audio_sample_rate_setting              = self.audio_sample_rate["48 khz"]
-        self.audio_sample_rate_modifier_setting     = self.audio_sample_rate_modifier["x1"]
-        self.word_multiplier_1_6_setting            = self.word_multiplier_1_6["x1"]
-        self.word_multiplier_7_8_setting            = self.word_multiplier_7_8["x1"]
-        self.AES_multiplier_setting                 = self.AES_multiplier["x1"]
-        self.SPDIF_multiplier_setting               = self.SPDIF_multiplier["x1"]
-
-        self.current_config = None  # Puts all the settings above into a list
-        self._update_current_config()
-
-        self._connect()
-        self._get_current_config()
-
-    def _update_current_config(self):
-        """ Updates the current config list """
-
-        self.current_config =   [self.cursor_pos,
-                                self.video_ref_setting,
-                                self.video_standard_setting,
-                                self.HD_standard_setting,
-                                self.FPS_setting,
-                                self.video_1_to_3_setting,
-                                self.video_4_setting,
-                                self.video_5_setting,
-                                self.video_6_setting,
-                                self.audio_ref_setting,
-                                self.external_word_fs_setting,
-                                self.external_word_fs_multiplier_setting,
-                                self.external_word_fs_modifier_setting,
-                                self.external_LTC_fps_setting,
-                                self.audio_sample_rate_setting,
-                                self.audio_sample_rate_modifier_setting,
-                                self.word_multiplier_1_6_setting,
-                                self.word_multiplier_7_8_setting,
-                                self.AES_multiplier_setting,
-                                self.SPDIF_multiplier_setting]
-
-    def _send_message(self, message, new_config=False):
-        """Formats with the midi system exclusive header and footer then sends the command via the midi out"""
-
-        if new_config is False:
-            header = [240, 44, 78, 83]
-            footer = [247]
-        else: # if a new config is being sent the header needs to changed
-            header = [240, 44, 78, 83, 15]
-            footer = [247]
-
-        message = header + message + footer
-        self.nanosync_midi_out.send_message(message)
-
-    def _receive_message(self):
-        """Makes 5 attempts to read a message from the midi buffer - If nothing is found an IO error is raised"""
-
-        for i in range(5):
-            return_message = self.nanosync_midi_in.get_message()
-            if return_message is not None:
-                return return_message
-            time.sleep(0.1)
-        else:
-            raise IOError("did not receive message from Nanosync after attempts")
+    if field not in FIELDS:
+        raise ValueError("unknown setting %s" % field)
+    table = FIELDS[field].table
+    if value not in table.inverse:
+        raise ValueError("invalid value %r for %s" % (value, field))
+    return table.inverse[value]
 
-    def _get_current_config(self):
-        """Function sends the get current config command to nanosyncs, reads data back, formats it and then saves data
-         to each variable """
 
+class NanoSyncConfig:
+    """Immutable nanosyncs config - the 20 setting bytes in the order they are sent to the device
 
-        self._send_message(self.query_current_Config)
-        received_config = self._receive_message()
-        # midi library return a tuple containing meta data and a list of all the settings
-        received_config = received_config[0]  # strip meta data
-        received_config = received_config[5:-1]  # Strips the midi system exclusive header and footer
-
-        self.cursor_pos                             = received_config[0]
-        self.video_ref_setting                      = received_config[1]
-        self.video_standard_setting                 = received_config[2]
-        self.HD_standard_setting                    = received_config[3]
-        self.FPS_setting                            = received_config[4]
-        self.video_1_to_3_setting                   = received_config[5]
-        self.video_4_setting                        = received_config[6]
-        self.video_5_setting                        = received_config[7]
-        self.video_6_setting                        = received_config[8]
-
-        self.audio_ref_setting                      = received_config[9]
-        self.external_word_fs_setting               = received_config[10]
-        self.external_word_fs_multiplier_setting    = received_config[11]
-        self.external_word_fs_modifier_setting      = received_config[12]
-        self.external_LTC_fps_setting               = received_config[13]
-        self.audio_sample_rate_setting              = received_config[14]
-        self.audio_sample_rate_modifier_setting     = received_config[15]
-        self.word_multiplier_1_6_setting            = received_config[16]
-        self.word_multiplier_7_8_setting            = received_config[17]
-        self.AES_multiplier_setting                 = received_config[18]
-        self.SPDIF_multiplier_setting               = received_config[19]
-
-        self._update_current_config()
-
-    def _select_correct_ports(self):
-        available_out_ports = self.nanosync_midi_out.get_ports()
-        available_in_ports = self.nanosync_midi_in.get_ports()
+    Bytes can be read by name (config.fps) or index (config[4]), replace(fps=3) returns a changed copy. Configs
+    compare and hash by value so they can be used as dict keys, and the config write frame is only encoded once"""
 
-        # rtpmidi returns a list of of midi devices that may be in different orders
-        # function selects port based the name
+    __slots__ = ("_data", "_frame")
 
-        for i, elem in enumerate(available_in_ports):
-            if 'NANOSYNCS' in elem:
-                print("found nanosync in port on %i" % i)
-                self.midi_in_port = i
-                break
-        else:
-            raise IOError("unable to find nano sync midi out port")
+    def __init__(self, data):
+        data = bytes(data)
+        if len(data) != 20:
+            raise ValueError("a nanosyncs config is 20 bytes, got %i" % len(data))
+        object.__setattr__(self, "_data", data)
+        object.__setattr__(self, "_frame", None)
 
-        for i, elem in enumerate(available_out_ports):
-            if 'NANOSYNCS' in elem:
-                print("found nanosync out port on %i" % i)
-                self.midi_out_port = i
-                break
-        else:
-            raise IOError("unable to find nano sync midi in port")
+    def __setattr__(self, name, value):
+        raise AttributeError("NanoSyncConfig is immutable, use replace()")
 
-    def _connect(self):
+    def __delattr__(self, name):
+        raise AttributeError("NanoSyncConfig is immutable")
 
-        # Should initialise the midi in and out ports
-        # Should select the correct port from the list of devices
-        # Should verify that the connection is successful by sending the return serial device
+    def replace(self, **fields):
+        """Returns a copy with the given bytes changed, eg. config.replace(hd_standard=5, fps=5)"""
 
-        self.nanosync_midi_in.ignore_types(sysex=False) # Allow system exclusive commands to be sent
+        data = bytearray(self._data)
+        for field, value in fields.items():
+            if field not in _CONFIG_OFFSETS:
+                raise ValueError("unknown config field %s" % field)
+            data[_CONFIG_OFFSETS[field]] = value
+        return NanoSyncConfig(data)
 
-        self.nanosync_midi_out.open_port(self.midi_out_port)
-        self.nanosync_midi_in.open_port(self.midi_in_port)
+    def to_bytes(self):
+        return self._data
 
-        self._send_message(self.serial_message)
-        info = self._receive_message()
-        if info is None:
-            raise IOError("failed to communicate with nanosync")
+    def to_sysex(self):
+        """Returns the frame that writes this config to the nanosyncs"""
 
-        else:
-            info = info[0]  # midi library returns a tuple with extra data, this strips it
-            info = info[5:-1]  # this strips the padding of the return message
-            serial_number = info[:4]
-            firmware = info[4:]
+        frame = self._frame
+        if frame is None:
+            frame = _CONFIG_WRITE_HEADER + self._data + _FOOTER
+            object.__setattr__(self, "_frame", frame)
+        return frame
 
-            for char in serial_number:
-                self.serial_number += chr(char)
-            for char in firmware:
-                self.firmware_version += chr(char)
-            self.firmware_version = self.firmware_version[:2] + '.' + self.firmware_version[2:]
+    @classmethod
+    def from_sysex(cls, frame):
+        """Builds a config from a config reply (command 3) or a config write (0x0F) frame"""
 
-            print("connected to NanoSync")
-            print("serial number: %s" % self.serial_number)
-            print("Firmware version %s" %  self.firmware_version)
+        frame = bytes(frame)
+        if frame[:4] != _CONFIG_WRITE_HEADER[:4] or frame[-1:] != _FOOTER or frame[4] not in (3, 15):
+            raise ValueError("not a nanosyncs config frame")
 
-    def disconnect(self):
-        self.nanosync_midi_out.close_port()
-        self.nanosync_midi_in.close_port()
+        config = cls(frame[5:-1])
+        if frame[4] == 15:
+            object.__setattr__(config, "_frame", frame)  # already the frame to_sysex() would build
+        return config
 
-    def print_current_config(self):
-        """Prints the current config to console - used for user readability"""
-        self._get_current_config()
-
-        print("video ref: %s" %                   self.video_ref.inverse[self.video_ref_setting])
-        print("video standard: %s" %              self.video_standard.inverse[self.video_standard_setting])
-        print("HD standard: %s" %                 self.HD_standard.inverse[self.HD_standard_setting])
-        print("FPS: %s" %                         self.FPS.inverse[self.FPS_setting])
-        print("SDI out 1 to 3: %s" %              self.video_definition.inverse[self.video_1_to_3_setting])
-        print("SDI out 4: %s" %                   self.video_definition.inverse[self.video_4_setting])
-        print("SDI out 5: %s" %                   self.video_definition.inverse[self.video_5_setting])
-        print("SDI out 6: %s" %                   self.video_definition.inverse[self.video_6_setting])
-
-        print("Audio ref: %s" %                   self.audio_ref.inverse[self.audio_ref_setting])
-        print("External word: %s" %               self.external_word_fs.inverse[self.external_word_fs_setting])
-        print("External word multiplier: %s" %    self.external_word_fs_multiplier.inverse[self.external_word_fs_multiplier_setting])
-        print("External word fs 1: %s" %          self.external_word_fs_modifier.inverse[self.external_word_fs_modifier_setting])
-        print("External LTC fps: %s" %            self.external_LTC_fps.inverse[self.external_LTC_fps_setting])
-        print("Audio sample rate: %s" %           self.audio_sample_rate.inverse[self.audio_sample_rate_setting])
-        print("Sample rate pull factor: %s" %     self.audio_sample_rate_modifier.inverse[self.audio_sample_rate_modifier_setting])
-        print("word mult 1 to 6: %s" %            self.word_multiplier_1_6.inverse[self.word_multiplier_1_6_setting])
-        print("word mult 7 to 8: %s" %            self.word_multiplier_7_8.inverse[self.word_multiplier_7_8_setting])
-        print("AES mult: %s" %                    self.AES_multiplier.inverse[self.AES_multiplier_setting])
-        print("SPDIF mult: %s" %                  self.SPDIF_multiplier.inverse[self.SPDIF_multiplier_setting])
-
-    def get_current_refresh_rate(self):
-        """Returns a named tuple containing the numerator and denominator to calculate the refresh rate"""
-
-        # self.HD_standard_setting = 1  # byte 3: 1080i x 2fps = 1, 1080p = 2, 1080p x 2fps = 3, 720p = 4, 720p x 2fps = 5
-        # self.FPS_setting = 1          # byte 4: 23.98fps = 1, 24fps = 2, 25fps = 3, 29.97fps = 4, 30fps = 5
-
-        fps_dict = {
-            1: 23.98,
-            2: 24,
-            3: 25,
-            4: 29.97,
-            5: 30}
-
-        tuple_dict = {
-
-            60: ("60", "1"),
-            50: ("50", "1"),
-            48: ("48", "1"),
-            30: ("30", "1"),
-            25: ("25", "1"),
-            24: ("24", "1"),
-
-            59.94: ("60000", "1001"),
-            47.96: ("48000", "1001"),
-            29.97: ("30000", "1001"),
-            23.98: ("24000", "1001")}
-
-        self._get_current_config()  # Make sure we have the latest data
-
-        refresh_rate = fps_dict.get(self.FPS_setting)
-
-        if self.HD_standard_setting in [3, 5]:  # if HD standard is 1080p x 2fps or 720p x 2fps
-            refresh_rate *= 2
-
-            refresh_rate_ntp = namedtuple("refresh rate", "numerator denominator")
-            return_tuple = refresh_rate_ntp(tuple_dict.get(refresh_rate))
-            return return_tuple
+    def __len__(self):
+        return 20
 
-        else:
+    def __iter__(self):
+        return iter(self._data)
 
-            refresh_rate_ntp = namedtuple("refresh rate", "numerator denominator")
-            return_tuple = refresh_rate_ntp(tuple_dict.get(refresh_rate))
-            return return_tuple
+    def __getitem__(self, index):
+        return self._data[index]
 
-    def send_new_config_raw(self, new_config):
-        """Accepts a list of 20 values corresponding to each of the settings of the nanosyncs """
+    def __eq__(self, other):
+        if isinstance(other, NanoSyncConfig):
+            return self._data == other._data
+        return NotImplemented
 
-        # some basic parameter checking
-        if type(new_config) is not list:
-            print("Command has to be a list")
-            return
-        if len(new_config) is not 20:
-            print("command has to 20 items long ")
+    def __hash__(self):
+        return hash(self._data)
 
-        # gets the latest state of the nanosync configuration
-        self._get_current_config()
-        comparision = self.current_config
+    def __reduce__(self):
+        return NanoSyncConfig, (self._data,)
 
-        if new_config == comparision:
-            print("Nanosyncs already has identical config set, skipping sending the new config ")
-        else:
-            for i in range(5):
-                self._send_message(new_config, new_config= True)
-                self._get_current_config()
-                if new_config == self.current_config:  # This may provide a false positive if the nanosync is pre-configured with the same setting being sent
-                    print("successfully sent command")
-                    break
-            else:
-                print("!!! warning - detected no change in the config of the Nanosync message send may of failed")
-                time.sleep(0.1)
+    def __repr__(self):
+        return "NanoSyncConfig(%s)" % list(self._data)
 
-    def set_video_ref(self, setting):
 
-        if setting in ["internal", "external pal", "external ntsc", "external tri"]:
-            self.video_ref_setting = self.video_ref[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
+for _offset, _field in enumerate(CONFIG_FIELDS):
+    setattr(NanoSyncConfig, _field, property(lambda self, offset=_offset: self._data[offset]))
 
-            print("set video ref to %s " % setting)
-        else:
-            print("invalid setting has been given for video ref")
 
-    def set_video_standard(self, setting):
+def diff_configs(old, new):
+    """Returns a SettingChange for every setting that differs between two configs, the cursor position is ignored"""
 
-        if setting in ["ntsc", "pal 25", "pal 24", "pal 23.98"]:
-            self.video_standard_setting = self.video_standard[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
+    changes = []
+    for field in FIELDS.values():
+        old_value, new_value = old[field.offset], new[field.offset]
+        if old_value != new_value:
+            # a byte the tables don't know is reported as the raw value
+            changes.append(SettingChange(field.name, field.table.inverse.get(old_value, old_value),
+                                         field.table.inverse.get(new_value, new_value)))
+    return changes
 
-            print("set video standard to %s " % setting)
-        else:
-            print("invalid setting has been given for video standard")
+# the bytes each config offset accepts, built once from the field tables. The cursor position is set by the unit and
+# can be any midi data byte - every byte of a system exclusive frame has to be below 128
+LEGAL_CONFIG_BYTES = tuple(frozenset(range(128)) if name == "cursor_pos" else frozenset(FIELDS[name].table.values())
+                           for name in CONFIG_FIELDS)
 
-    def set_hd_standard(self, setting):
 
-        if setting in ["1080i x2 fps", "1080p x1 fps", "1080p x2 fps", "720p x1 fps", "720p x2 fps"]:
-            self.HD_standard_setting = self.HD_standard[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
-            print("set HD standard to %s " % setting)
-        else:
-            print("invalid setting has been given for HD standard")
+def is_valid_config(config):
+    """Returns True if every byte of a 20 value config is one the nanosyncs accepts"""
 
-    def set_fps(self, setting):
+    return len(config) == 20 and all(map(contains, LEGAL_CONFIG_BYTES, config))
 
-        if setting in ["23.98 fps", "24 fps", "25 fps", "29.97 fps", "30 fps"]:
-            self.FPS_setting = self.FPS[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
 
-            print("set FPS to %s " % setting)
-        else:
-            print("invalid setting has been given for FPS")
+def config_errors(config):
+    """Returns a list describing every problem with a config, empty if it is valid"""
 
-    def set_sdi_out_1_to_3(self, setting):
+    if len(config) != 20:
+        return ["a config is 20 values, got %i" % len(config)]
+    errors = []
+    for name, legal, value in zip(CONFIG_FIELDS, LEGAL_CONFIG_BYTES, config):
+        if value not in legal:
+            expected = "0 to 127" if name == "cursor_pos" else "one of %s" % sorted(legal)
+            errors.append("%s can't be %r, expected %s" % (name, value, expected))
+    return errors
 
-        if setting in ["SD", "HD"]:
-            self.video_1_to_3_setting = self.video_definition[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
 
-            print("set set SDI out 1 to 3 to %s " % setting)
-        else:
-            print("invalid setting has been given for SDI out 1 to 3")
+def check_config(config):
+    """Raises ValueError listing the problems with a config if it is not valid"""
 
-    def set_sdi_out_4(self, setting):
+    if not is_valid_config(config):
+        raise ValueError("invalid nanosyncs config: %s" % "; ".join(config_errors(config)))
 
-        if setting in ["SD", "HD"]:
-            self.video_4_setting= self.video_definition[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
 
-            print("set SDI out 4 to %s " % setting)
-        else:
-            print("invalid setting has been given for SDI out 4")
+def validate_configs(configs):
+    """Checks any number of configs without a device, returns a dict of index -> errors for the invalid ones"""
 
-    def set_sdi_out_5(self, setting):
+    return {index: config_errors(config) for index, config in enumerate(configs) if not is_valid_config(config)}
 
-        if setting in ["SD", "HD"]:
-            self.video_5_setting= self.video_definition[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
 
-            print("set SDI out 5 to %s " % setting)
+def plan_writes(current, *targets):
+    """Returns the config writes that take a unit from the current config through each target in turn
+
+    A target is a complete config or a dict of apply() keywords merged into the state before it. Every write is a
+    whole config so each target takes at most one write, targets that don't change any setting are skipped and the
+    cursor position is left where the unit has it. Raises ValueError before anything is planned if a target is
+    invalid"""
+
+    state = current if isinstance(current, NanoSyncConfig) else NanoSyncConfig(current)
+    writes = []
+    for target in targets:
+        if isinstance(target, dict):
+            target = state.replace(**{field: encode_setting(field, setting) for field, setting in target.items()})
         else:
-            print("invalid setting has been given for SDI out 5")
+            check_config(target)
+            target = NanoSyncConfig(target).replace(cursor_pos=state.cursor_pos)
+        if diff_configs(state, target):
+            writes.append(target)
+            state = target
+    return writes
 
-    def set_sdi_out_6(self, setting):
 
-        if setting in ["SD", "HD"]:
-            self.video_6_setting= self.video_definition[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
+# what happened to a change passed to NanoSync.schedule_apply - times are time.monotonic(), landed is the estimated
+# time the unit applied the change, the read back confirming it less the round trip of a config query, and error is
+# landed - target in seconds
+LandingReport = namedtuple("LandingReport", "target sent landed acked error config")
 
-            print("set SDI out 5 to %s " % setting)
-        else:
-            print("invalid setting has been given for SDI out 5")
+# the config a NanoSync starts with before it has read the one on the device
+DEFAULT_CONFIG = NanoSyncConfig([0] + [field.table[field.default] for field in FIELDS.values()])
 
-    def set_audio_reference(self, setting):
 
-        if setting in ["follow video", "external word clock", "external word 1:1", "LTC"]:
-            self.audio_ref_setting= self.audio_ref[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
+class Transport(ABC):
+    """Interface between NanoSync and whatever carries the system exclusive frames to the device
 
-            print("set audio reference to %s " % setting)
-        else:
-            print("invalid setting has been given for audio reference")
+    A frame is a list of ints including the F0 header and F7 footer. Received frames are passed to the callback given
+    to open(), which may be called from any thread. A transport missing one of the methods can't be created"""
 
-    def set_external_word_fs(self, setting):
+    @abstractmethod
+    def list_ports(self):
+        """Returns a tuple of (in port names, out port names)"""
 
-        if setting in ["44.1 khz", "48 khz"]:
-            self.external_word_fs_setting = self.external_word_fs[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
+    @abstractmethod
+    def open(self, in_port, out_port, callback):
+        """Opens the ports by index and starts delivering received frames to callback(frame)"""
 
-            print("set external word FS to %s " % setting)
-        else:
-            print("invalid setting has been given external word FS")
+    @abstractmethod
+    def send_frame(self, frame):
+        """Sends a frame, raises IOError if it can't be sent"""
 
-    def set_external_word_multiplier(self, setting):
+    @abstractmethod
+    def close(self):
+        """Closes the ports, no frames are delivered afterwards"""
 
-        if setting in ["x1", "x2"]:
-            self.external_word_fs_multiplier_setting = self.external_word_fs_multiplier[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
 
-            print("set external word multiplier to %s " % setting)
-        else:
-            print("invalid setting has been given for external word multiplier")
+class MidiTransport(Transport):
+    """Talks to a real nanosyncs through rtmidi"""
 
-    def set_external_word_modifier(self, setting):
+    def __init__(self):
+        import rtmidi  # only loaded once a real midi connection is needed
 
-        if setting in ["1/1", "+0.1%"]:
-            self.external_word_fs_modifier_setting = self.external_word_fs_modifier[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
+        self.midi_out = rtmidi.MidiOut()
+        self.midi_in = rtmidi.MidiIn()
 
-            print("set external word modifier to %s " % setting)
-        else:
-            print("invalid setting has been given for external word modifier")
+    def list_ports(self):
+        return self.midi_in.get_ports(), self.midi_out.get_ports()
 
-    def set_external_ltc_fps(self, setting):
+    def open(self, in_port, out_port, callback):
+        self.midi_in.ignore_types(sysex=False) # Allow system exclusive commands to be sent
+        # rtmidi passes a (message, delta time) tuple and the user data, only the message is handed on
+        self.midi_in.set_callback(lambda event, data=None: callback(event[0]))
 
-        if setting in ["23.98 fps", " 24 fps", "25 fps", "29.98 fps", "30 fps"]:
-            self.external_LTC_fps_setting = self.external_LTC_fps[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
+        self.midi_out.open_port(out_port)
+        self.midi_in.open_port(in_port)
 
-            print("set external LTC FPS to %s " % setting)
-        else:
-            print("invalid setting has been given for external LTC FPS")
+    def send_frame(self, frame):
+        try:
+            self.midi_out.send_message(frame)
+        except Exception as error:  # rtmidi has its own error types, callers only need to know the send failed
+            raise IOError("unable to send to the nanosyncs: %s" % error)
 
-    def set_audio_sample_rate(self, setting):
+    def close(self):
+        self.midi_in.cancel_callback()
+        self.midi_out.close_port()
+        self.midi_in.close_port()
 
-        if setting in ["48 khz", "44.1 khz"]:
-            self.audio_sample_rate_setting = self.audio_sample_rate[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
 
-            print("set audio sample rate to %s " % setting)
-        else:
-            print("invalid setting has been given for the audio sample rate")
+def find_nanosync_ports(transport=None):
+    """Returns a list of (midi in port, midi out port) pairs, one for every connected nanosyncs"""
 
-    def set_audio_sample_rate_modifier(self, setting):
+    if transport is None:
+        transport = MidiTransport()
+    return _pair_nanosync_ports(*transport.list_ports())
 
-        if setting in ["x1", "+4%", "+0.1%", "-0.1%", "-4%"]:
-            self.audio_sample_rate_modifier_setting = self.audio_sample_rate_modifier[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
 
-            print("set audio sample rate modifier to %s " % setting)
-        else:
-            print("invalid setting has been given for audio sample rate modifier ")
+def _pair_nanosync_ports(available_in_ports, available_out_ports):
+    """Returns the (in port, out port) pairs of the nanosyncs among the listed port names"""
 
-    def set_word_multiplier_1_6(self, setting):
+    # rtpmidi returns a list of of midi devices that may be in different orders
+    # each nanosyncs in port is paired with the out port of the same name, ports sharing a name are paired in the
+    # order they are listed and a port without a partner of the same name is left out
+    out_ports = {}
+    for i, elem in enumerate(available_out_ports):
+        if 'NANOSYNCS' in elem:
+            out_ports.setdefault(elem, deque()).append(i)
 
-        if setting in ["x1", "x2", "x4"]:
-            self.word_multiplier_1_6_setting = self.word_multiplier_1_6[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
+    pairs = []
+    for i, elem in enumerate(available_in_ports):
+        if out_ports.get(elem):
+            pairs.append((i, out_ports[elem].popleft()))
+    return pairs
 
-            print("set word multiplier 1 to 6 to %s " % setting)
-        else:
-            print("invalid setting has been given word multiplier 1 to 6")
 
-    def set_word_multiplier_7_8(self, setting):
+def _median(values):
+    """Returns the median of a non empty collection of numbers, the upper one of the middle two for an even count"""
 
-        if setting in ["x1", "x2", "x4", "x256"]:
-            self.word_multiplier_7_8_setting = self.word_multiplier_7_8[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
+    values = sorted(values)
+    return values[len(values) // 2]
 
-            print("set word multiplier 7 to 8 to %s " % setting)
-        else:
-            print("invalid setting has been given for word multiplier 7 to 8")
 
-    def set_AES_multiplier(self, setting):
+class RetryPolicy:
+    """How a config write is retried when the settings read back don't match the ones sent
+
+    Up to max_attempts writes are made. Before each retry the handle waits backoff seconds, multiplied by multiplier
+    after every attempt up to max_backoff, with up to jitter of it taken off at random so that several hosts on a busy
+    link don't retry in step. With deadline set no attempt is started after that many seconds from the first write,
+    and the read back of the last one waits at most until the deadline, so a write takes no longer than deadline plus
+    the time to send one frame"""
+
+    def __init__(self, max_attempts=5, backoff=0.01, multiplier=2.0, max_backoff=0.2, jitter=0.5, deadline=None):
+
+        if max_attempts < 1:
+            raise ValueError("max_attempts has to be at least 1")
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.deadline = deadline
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number attempt, counting from 1"""
+
+        import random
+
+        delay = min(self.max_backoff, self.backoff * self.multiplier ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def __repr__(self):
+        return ("RetryPolicy(max_attempts=%r, backoff=%r, multiplier=%r, max_backoff=%r, jitter=%r, deadline=%r)"
+                % (self.max_attempts, self.backoff, self.multiplier, self.max_backoff, self.jitter, self.deadline))
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+class ConfigWriteError(IOError):
+    """Raised when the settings read back after a config write never matched the ones sent
+
+    expected is the NanoSyncConfig that was written, observed the last config read back from the nanosyncs and fields
+    the names of the settings that were checked"""
+
+    def __init__(self, message, expected, observed, fields, attempts):
+        super().__init__(message)
+        self.expected = expected
+        self.observed = observed
+        self.fields = fields
+        self.attempts = attempts
+
+
+class LinkLostError(IOError):
+    """Raised while a supervised NanoSync has lost the link to its unit and is reconnecting, see ConnectionSupervisor"""
+
+
+class WrongUnitError(IOError):
+    """Raised by NanoSync.connect when the unit on the ports answers with another serial number than the one expected
+
+    serial_number is the serial number of the unit that answered"""
+
+    def __init__(self, message, serial_number):
+        super().__init__(message)
+        self.serial_number = serial_number
+
+
+_COMMAND_NAMES = {1: "serial_query", 3: "config_query", 15: "config_write"}
+
+
+class NanoSyncMetrics:
+    """Counters and latency histograms for the exchanges of one or more NanoSync / AsyncNanoSync handles
+
+    metrics = NanoSyncMetrics(hooks=[logging_hook()])
+    sync = NanoSync(metrics=metrics)
+    print(metrics.to_prometheus())
+
+    Everything is labelled with the serial number of the unit and the command type. Each hook is called as
+    hook(event, fields) for every event recorded, eg. hook("timeout", {"serial": "1234", "command": "config_query",
+    "seconds": 0.5}). Handles without metrics skip all of this"""
+
+    # upper bounds in seconds of the latency histogram buckets, the last bucket is +Inf
+    LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.5)
+
+    def __init__(self, buckets=LATENCY_BUCKETS, hooks=()):
+
+        self.buckets = tuple(sorted(buckets))
+        self.hooks = list(hooks)
+
+        self.frames_sent = {}          # (serial, command) -> count
+        self.frames_received = {}      # (serial, command) -> count
+        self.timeouts = {}             # (serial, command) -> count
+        self.latency = {}              # (serial, command) -> [count per bucket..., +Inf count, sum of seconds]
+        self.retries = {}              # serial -> count of config writes sent again after a failed verify
+        self.verify_mismatches = {}    # serial -> count of configs read back that differ from the one written
+        self.config_writes = {}        # (serial, result) -> count, result is verified, failed or skipped
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def _emit(self, event, **fields):
+        for hook in self.hooks:
+            hook(event, fields)
+
+    def _count(self, counter, key):
+        with self._lock:
+            counter[key] = counter.get(key, 0) + 1
+
+    def frame_sent(self, serial, command):
+        command = _COMMAND_NAMES.get(command, str(command))
+        self._count(self.frames_sent, (serial, command))
+        self._emit("frame_sent", serial=serial, command=command)
+
+    def frame_received(self, serial, command):
+        command = _COMMAND_NAMES.get(command, str(command))
+        self._count(self.frames_received, (serial, command))
+        self._emit("frame_received", serial=serial, command=command)
+
+    def exchange(self, serial, command, seconds):
+        """Records the time from sending a frame to its reply, or to the verified read back for a config write"""
+
+        command = _COMMAND_NAMES.get(command, str(command))
+        with self._lock:
+            histogram = self.latency.get((serial, command))
+            if histogram is None:
+                histogram = self.latency[(serial, command)] = [0] * (len(self.buckets) + 1) + [0.0]
+            index = 0
+            while index < len(self.buckets) and seconds > self.buckets[index]:
+                index += 1
+            histogram[index] += 1
+            histogram[-1] += seconds
+        self._emit("exchange", serial=serial, command=command, seconds=seconds)
+
+    def timeout(self, serial, command, seconds):
+        command = _COMMAND_NAMES.get(command, str(command))
+        self._count(self.timeouts, (serial, command))
+        self._emit("timeout", serial=serial, command=command, seconds=seconds)
+
+    def retry(self, serial, attempt):
+        self._count(self.retries, serial)
+        self._emit("retry", serial=serial, attempt=attempt)
+
+    def verify_mismatch(self, serial, expected, observed):
+        self._count(self.verify_mismatches, serial)
+        self._emit("verify_mismatch", serial=serial, expected=list(expected), observed=list(observed),
+                   changes=[change.field for change in diff_configs(expected, observed)])
+
+    def config_write(self, serial, result):
+        self._count(self.config_writes, (serial, result))
+        self._emit("config_write", serial=serial, result=result)
 
-        if setting in ["x1", "x2"]:
-            self.AES_multiplier_setting = self.AES_multiplier[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
-            print("set AES multiplier to %s " % setting)
+    def snapshot(self):
+        """Returns every counter as plain dicts and lists, eg. to be dumped as JSON"""
+
+        with self._lock:
+            return {
+                "frames_sent": [list(key) + [count] for key, count in self.frames_sent.items()],
+                "frames_received": [list(key) + [count] for key, count in self.frames_received.items()],
+                "timeouts": [list(key) + [count] for key, count in self.timeouts.items()],
+                "latency": [list(key) + [{"buckets": dict(zip(self.buckets + ("+Inf",), histogram[:-1])),
+                                          "count": sum(histogram[:-1]), "sum": histogram[-1]}]
+                            for key, histogram in self.latency.items()],
+                "retries": dict(self.retries),
+                "verify_mismatches": dict(self.verify_mismatches),
+                "config_writes": [list(key) + [count] for key, count in self.config_writes.items()]}
+
+    def to_prometheus(self, prefix="nanosync"):
+        """Returns the metrics in the Prometheus text exposition format"""
+
+        def labels(**values):
+            return "{%s}" % ",".join('%s="%s"' % (name, value) for name, value in values.items())
+
+        lines = []
+
+        def counter(name, help_text, counts, label_names):
+            lines.append("# HELP %s_%s %s" % (prefix, name, help_text))
+            lines.append("# TYPE %s_%s counter" % (prefix, name))
+            for key, count in sorted(counts.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                lines.append("%s_%s%s %i" % (prefix, name, labels(**dict(zip(label_names, key))), count))
+
+        with self._lock:
+            counter("frames_sent_total", "System exclusive frames sent to the nanosyncs", self.frames_sent,
+                    ("serial", "command"))
+            counter("frames_received_total", "System exclusive frames received from the nanosyncs",
+                    self.frames_received, ("serial", "command"))
+            counter("timeouts_total", "Requests that got no reply in time", self.timeouts, ("serial", "command"))
+            counter("retries_total", "Config writes sent again after the read back did not match", self.retries,
+                    ("serial",))
+            counter("verify_mismatches_total", "Configs read back that differ from the one written",
+                    self.verify_mismatches, ("serial",))
+            counter("config_writes_total", "Config writes by result", self.config_writes, ("serial", "result"))
+
+            lines.append("# HELP %s_exchange_seconds Time from sending a frame to its reply" % prefix)
+            lines.append("# TYPE %s_exchange_seconds histogram" % prefix)
+            for (serial, command), histogram in sorted(self.latency.items()):
+                total = 0
+                for bound, count in zip(self.buckets + ("+Inf",), histogram[:-1]):
+                    total += count
+                    lines.append("%s_exchange_seconds_bucket%s %i"
+                                 % (prefix, labels(serial=serial, command=command, le=bound), total))
+                lines.append("%s_exchange_seconds_sum%s %r" % (prefix, labels(serial=serial, command=command),
+                                                              histogram[-1]))
+                lines.append("%s_exchange_seconds_count%s %i" % (prefix, labels(serial=serial, command=command),
+                                                                total))
+
+        return "\n".join(lines) + "\n"
+
+
+def logging_hook(logger=None, level=None):
+    """Returns a NanoSyncMetrics hook that logs every event with its fields as JSON, eg.
+    nanosync timeout {"serial": "1234", "command": "config_query", "seconds": 0.5}
+
+    The fields are also attached to the log record as record.nanosync for structured log handlers"""
+
+    import json
+    import logging
+
+    logger = logger or logging.getLogger("nanosync")
+    level = logging.DEBUG if level is None else level
+
+    def hook(event, fields):
+        if logger.isEnabledFor(level):
+            logger.log(level, "nanosync %s %s", event, json.dumps(fields), extra={"nanosync": dict(fields, event=event)})
+
+    return hook
+
+
+class _NanoSyncBase:
+    """Settings tables and config handling shared by NanoSync and AsyncNanoSync"""
+
+    def __init__(self, transport=None, in_port=None, out_port=None, serial_number=None, metrics=None,
+                 retry_policy=None):
+
+        self.serial_number = serial_number or ""
+        self.firmware_version = ""
+
+        # frames go through rtmidi unless another transport is given, eg. an emulated nanosyncs. The default one is
+        # only created when the ports are first needed
+        self.transport = transport
+
+        # the first nanosyncs found is used unless the ports are given, see find_nanosync_ports. The names of the
+        # ports are kept once connected, the numbers can change when devices are plugged in or out
+        self.midi_in_port = in_port
+        self.midi_out_port = out_port
+        self.midi_in_name = None
+        self.midi_out_name = None
+
+        # the settings are held in an immutable NanoSyncConfig which is swapped whole whenever the config changes.
+        # The *_setting attributes read and replace single bytes of it. Readers take a reference to the current one
+        # and never lock, writers swap it under _state_lock so that two changes made at once are never lost
+        self.config = DEFAULT_CONFIG
+        self._state_lock = threading.Lock()
+        self._config_time = None    # time.monotonic() of the last config read from the nanosyncs, None if never read
+
+        # NanoSyncMetrics recording every exchange, None leaves the exchanges uninstrumented. Frames of the serial
+        # number handshake are held back until the reply names the unit, so every unit has a single series
+        self.metrics = metrics
+        self._held_metrics = []
+
+        # how config writes are retried until the settings changed are read back, see RetryPolicy
+        self.retry_policy = retry_policy or DEFAULT_RETRY_POLICY
+
+    @property
+    def current_config(self):
+        """The current config as a list of 20 values"""
+        return list(self.config)
+
+    def _send_message(self, frame):
+        """Sends a complete system exclusive frame to the nanosyncs"""
+
+        self.transport.send_frame(frame)
+        if self.metrics is not None:
+            self._record("frame_sent", frame[4])
+
+    def _record(self, event, *args):
+        """Records a metrics event labelled with the serial number - held back while the serial number is unknown"""
+
+        if not self.serial_number:
+            with self._state_lock:
+                if not self.serial_number:
+                    self._held_metrics.append((event, args))
+                    return
+        getattr(self.metrics, event)(self.serial_number, *args)
+
+    def _record_held(self, serial_number):
+        """Records the events held back during the handshake under the serial number, or the port name if it failed"""
+
+        with self._state_lock:
+            held, self._held_metrics = self._held_metrics, []
+        for event, args in held:
+            getattr(self.metrics, event)(serial_number, *args)
+
+    def _store_config(self, received_config):
+        """Saves a 20 byte config received from the nanosyncs to each variable"""
+
+        if len(received_config) != 20:
+            raise IOError("Nanosync returned a config of %i bytes instead of 20" % len(received_config))
+
+        self.config = NanoSyncConfig(received_config)
+
+    @staticmethod
+    def _parse_info(info):
+        """Returns the serial number and firmware version in the reply to the serial message"""
+
+        info = info[5:-1]  # this strips the padding of the return message
+        serial_number = "".join(chr(char) for char in info[:4])
+        firmware = "".join(chr(char) for char in info[4:])
+        return serial_number, firmware[:2] + '.' + firmware[2:]
+
+    def _store_info(self, info):
+        """Saves the serial number and firmware version from the reply to the serial message"""
+
+        with self._state_lock:  # events recorded from here on are labelled directly, see _record
+            self.serial_number, self.firmware_version = self._parse_info(info)
+        if self.metrics is not None:
+            self._record_held(self.serial_number)
+
+        print("connected to NanoSync")
+        print("serial number: %s" % self.serial_number)
+        print("Firmware version %s" %  self.firmware_version)
+
+    def _open_transport(self, callback):
+        """Creates the default transport if none was given, finds the ports if they are not known and opens them"""
+
+        if self.transport is None:
+            self.transport = MidiTransport()
+        available_in_ports, available_out_ports = self.transport.list_ports()
+        if self.midi_in_port is None or self.midi_out_port is None:
+            self._select_correct_ports(available_in_ports, available_out_ports)
+        self.transport.open(self.midi_in_port, self.midi_out_port, callback)
+        self.midi_in_name = available_in_ports[self.midi_in_port]
+        self.midi_out_name = available_out_ports[self.midi_out_port]
+
+    def _select_correct_ports(self, available_in_ports, available_out_ports):
+
+        # rtpmidi returns a list of of midi devices that may be in different orders
+        # the first nanosyncs is used, its in and out ports are paired by name, see find_nanosync_ports
+
+        if not any('NANOSYNCS' in elem for elem in available_in_ports):
+            raise IOError("unable to find nano sync midi in port")
+        if not any('NANOSYNCS' in elem for elem in available_out_ports):
+            raise IOError("unable to find nano sync midi out port")
+        port_pairs = _pair_nanosync_ports(available_in_ports, available_out_ports)
+        if not port_pairs:
+            raise IOError("unable to find a nano sync midi out port with the name of its in port")
+
+        self.midi_in_port, self.midi_out_port = port_pairs[0]
+        print("found nanosync in port on %i" % self.midi_in_port)
+        print("found nanosync out port on %i" % self.midi_out_port)
+
+    @staticmethod
+    def _raw_config(new_config):
+        """Returns a list of 20 values, or a NanoSyncConfig, as a NanoSyncConfig - raises ValueError if it is not a
+        valid config, so it is refused here rather than failing every verify on the device"""
+
+        if type(new_config) is not list and not isinstance(new_config, NanoSyncConfig):
+            raise ValueError("a config has to be a list of 20 values or a NanoSyncConfig, not %s"
+                             % type(new_config).__name__)
+        check_config(new_config)
+        return NanoSyncConfig(new_config)
+
+    def _check_setting(self, field, setting):
+        """Returns the byte value for a setting given by its apply() keyword, raises ValueError if it is not valid"""
+        return encode_setting(field, setting)
+
+    def _merge_fields(self, fields):
+        """Returns a copy of the current config with the given apply() keyword settings merged into it"""
+
+        # validate everything before changing anything so a bad value can't leave a half applied change
+        return self.config.replace(**{field: encode_setting(field, setting) for field, setting in fields.items()})
+
+    def _changed_fields(self, new_config, fields=None):
+        """Names of the settings a write is checked on - the fields given to apply, or every setting that differs
+        between the current config and new_config. The cursor position is never checked, the unit moves it itself"""
+
+        if fields is not None:
+            return tuple(fields)
+        return tuple(change.field for change in diff_configs(self.config, new_config))
+
+    def _write_landed(self, new_config, changed, start):
+        """Checks the config read back after a write against the settings changed"""
+
+        if all(self.config[FIELDS[name].offset] == new_config[FIELDS[name].offset] for name in changed):
+            print("successfully sent command")
+            if self.metrics is not None:
+                self.metrics.exchange(self.serial_number, 15, time.perf_counter() - start)
+                self.metrics.config_write(self.serial_number, "verified")
+            return True
+
+        if self.metrics is not None:
+            self.metrics.verify_mismatch(self.serial_number, new_config, self.config)
+        return False
+
+    def _write_skipped(self):
+        print("Nanosyncs already has identical config set, skipping sending the new config ")
+        if self.metrics is not None:
+            self.metrics.config_write(self.serial_number, "skipped")
+
+    def _write_failed(self, new_config, changed, attempts):
+        if self.metrics is not None:
+            self.metrics.config_write(self.serial_number, "failed")
+        return ConfigWriteError(
+            "detected no change in the config of the Nanosync after %i attempts, message send may of failed" % attempts,
+            new_config, self.config, changed, attempts)
+
+    def get_setting(self, field):
+        """Returns the label of a setting by its apply() keyword, eg. get_setting("fps") -> "30 fps" """
+        return decode_setting(field, self.config[FIELDS[field].offset])
+
+
+def _make_setting_property(field):
+    def set_byte(self, value):
+        with self._state_lock:
+            self.config = self.config.replace(**{field: value})
+    return property(lambda self: getattr(self.config, field), set_byte)
+
+
+def _make_getter(field):
+    def getter(self):
+        return self.get_setting(field.name)
+    getter.__name__ = field.getter
+    getter.__doc__ = "Returns the %s setting" % field.description
+    return getter
+
+
+# the lookup tables, *_setting attributes and getters are generated from FIELDS and shared by every instance
+for _table_name, _table in SETTING_TABLES.items():
+    setattr(_NanoSyncBase, _table_name, _table)
+_NanoSyncBase.cursor_pos = _make_setting_property("cursor_pos")
+for _field in FIELDS.values():
+    setattr(_NanoSyncBase, _field.attribute, _make_setting_property(_field.name))
+    setattr(_NanoSyncBase, _field.getter, _make_getter(_field))
+
+
+class NanoSync(_NanoSyncBase):
+
+    def __init__(self, timeout=0.5, in_port=None, out_port=None, max_age=0, transport=None, write_behind=None,
+                 connect=True, serial_number=None, metrics=None, retry_policy=None):
+        super().__init__(transport, in_port, out_port, serial_number, metrics, retry_policy)
+
+        # reads are served from the last config seen for up to max_age seconds, 0 queries the nanosyncs every time
+        self.max_age = max_age
+
+        # replies are delivered by the transport callback and matched to the request waiting on their command byte
+        self.response_timeout = timeout    # seconds to wait for a reply before raising an IOError
+        self._responses = {}               # command byte -> reply frame, None while a request is still waiting
+        self._response_received = threading.Condition()
+        # one exchange with the device at a time - a query, or a whole read, merge, write and verify for a change -
+        # so a handle can be shared by any number of threads. Getters don't take it, see _cached_config
+        self._exchange_lock = threading.RLock()
+
+        self._watchers = []                # ConfigWatchers told about every config change seen on the device
+        self._supervisor = None            # ConnectionSupervisor reconnecting after the link is lost, see supervise
+
+        # seconds from sending each of the latest config writes to the read back that confirmed it, and the round
+        # trips of the latest config queries, used to time the changes passed to schedule_apply
+        self._write_latencies = deque(maxlen=16)
+        self._query_latencies = deque(maxlen=16)
+        self._scheduler = None
+
+        # with connect=False nothing touches the device here, the connection is made by connect() or the first query
+        self.connected = False
+        if connect:
+            self.connect()
+
+        # with write_behind set to a number of seconds, changes are merged and written by a background worker
+        self._write_behind = None
+        if write_behind is not None:
+            self.enable_write_behind(write_behind)
+
+    def _on_frame(self, message):
+        """Transport callback - hands each nanosyncs frame to the request waiting for its command type"""
+
+        if len(message) < 6 or message[:4] != SYSEX_HEADER:
+            return  # not a nanosyncs system exclusive message
+
+        command = message[4]
+        if self.metrics is not None:
+            self._record("frame_received", command)
+
+        with self._response_received:
+            if command in self._responses and self._responses[command] is None:
+                self._responses[command] = message
+                self._response_received.notify_all()
+                return
+
+        # frames nobody is waiting for are dropped, apart from a config the nanosyncs sent by itself while being watched.
+        # While the link is lost the ports may belong to another unit being probed by the supervisor
+        if command == 3 and self._watchers and len(message) == 26 and not (self._supervisor is not None and self._supervisor.lost):
+            self._store_config(message[5:-1])
+            self._config_time = time.monotonic()
+
+    def _send_message(self, frame):
+        try:
+            super()._send_message(frame)
+        except IOError:
+            if self._supervisor is not None:
+                self._supervisor.send_failed()
+            raise
+
+    def _store_config(self, received_config):
+        with self._state_lock:
+            previous = self.config
+            super()._store_config(received_config)
+
+        if self._watchers and self.config != previous:
+            changes = diff_configs(previous, self.config)
+            for watcher in list(self._watchers):
+                watcher._notify(changes)
+
+    def _request(self, frame, timeout=None):
+        """Sends a query frame to the nanosyncs and returns the reply with the same command byte"""
+
+        command = frame[4]
+        with self._exchange_lock:
+            if self._supervisor is not None:
+                self._supervisor.check()
+            if not self.connected:
+                self.connect()
+            with self._response_received:
+                self._responses[command] = None  # register before sending so that a fast reply can't be missed
+            if self.metrics is None and self._supervisor is None:
+                self._send_message(frame)
+                return self._receive_message(command, timeout)
+
+            start = time.perf_counter()
+            try:
+                self._send_message(frame)
+                message = self._receive_message(command, timeout)
+            except IOError as error:
+                if self._supervisor is not None:
+                    self._supervisor.exchange_failed(error)
+                    self._supervisor.check()  # raises LinkLostError if the link went down with this exchange
+                raise
+            if self._supervisor is not None:
+                self._supervisor.exchange_succeeded()
+            if self.metrics is not None:
+                self._record("exchange", command, time.perf_counter() - start)
+            return message
+
+    def _receive_message(self, command, timeout=None):
+        """Waits for the reply to the given command - If nothing arrives before the timeout an IO error is raised"""
+
+        if timeout is None:
+            timeout = self.response_timeout
+
+        with self._response_received:
+            received = self._response_received.wait_for(lambda: self._responses.get(command) is not None, timeout)
+            message = self._responses.pop(command, None)
+
+        if not received:
+            if self.metrics is not None:
+                self._record("timeout", command, timeout)
+            raise IOError("did not receive message from Nanosync within %s seconds" % timeout)
+        return message
+
+    def _get_current_config(self, timeout=None):
+        """Function sends the get current config command to nanosyncs, reads data back, formats it and then saves data
+         to each variable """
+
+        start = time.monotonic()
+        received_config = self._request(CONFIG_QUERY_FRAME, timeout)
+        self._config_time = time.monotonic()
+        self._query_latencies.append(self._config_time - start)
+        self._store_config(received_config[5:-1])  # Strips the midi system exclusive header and footer
+
+    def _cached_config(self, force=False):
+        """Reads the config from the nanosyncs unless the last one seen is younger than max_age
+
+        Unless forced, a read doesn't wait while another thread is talking to the device, eg. writing a slow change,
+        the last config seen is kept instead - the exchange in progress reads the config anyway"""
+
+        if not self.connected:
+            self.connect()  # reads the config as it connects
+        elif force or self._config_time is None or time.monotonic() - self._config_time > self.max_age:
+            if not self._exchange_lock.acquire(blocking=force or self._config_time is None):
+                return
+            try:
+                self._get_current_config()
+            finally:
+                self._exchange_lock.release()
+
+    def get_config(self, force=False):
+        """Returns the current NanoSyncConfig, from the cache if it is younger than max_age"""
+
+        self._cached_config(force)
+        return self.config
+
+    def refresh(self):
+        """Reads the current config from the nanosyncs regardless of the age of the cached one"""
+
+        self._cached_config(force=True)
+
+    def invalidate(self):
+        """Marks the cached config as stale so the next read goes to the nanosyncs"""
+
+        self._config_time = None
+
+    def connect(self, handshake=None, expected_serial=None):
+        """Opens the midi ports, checks the connection with the serial number query and reads the current config
+
+        The serial number query is skipped when the serial number is already known, eg. given to the constructor or
+        from an earlier connection, unless handshake is True. With expected_serial the query is always made and if
+        another unit answers the ports are closed again and WrongUnitError is raised, without anything of that unit
+        being stored"""
+
+        with self._exchange_lock:
+            if self.connected:
+                return
+            if self._supervisor is not None:
+                self._supervisor.check()  # the supervisor is already looking for the unit
+
+            port_names = self.midi_in_name, self.midi_out_name
+            self._open_transport(self._on_frame)
+            self.connected = True
+            try:
+                if expected_serial is not None:
+                    serial_number, firmware_version = self._parse_info(self._request(SERIAL_QUERY_FRAME))
+                    if serial_number != expected_serial:
+                        raise WrongUnitError("nanosyncs %s answered on the ports instead of %s"
+                                             % (serial_number, expected_serial), serial_number)
+                    self.firmware_version = firmware_version
+                elif handshake or (handshake is None and not self.serial_number):
+                    self._store_info(self._request(SERIAL_QUERY_FRAME))
+                self._get_current_config()
+            except Exception:
+                self.connected = False
+                self.transport.close()
+                if self.metrics is not None:
+                    self._record_held(self.serial_number or self.midi_in_name)
+                self.midi_in_name, self.midi_out_name = port_names  # the ports the unit was last seen on
+                raise
+
+    def disconnect(self):
+        for watcher in list(self._watchers):
+            watcher.close()
+        self.disable_write_behind()
+        if self._scheduler is not None:
+            self._scheduler.close()
+            self._scheduler = None
+        if self._supervisor is not None:
+            self._supervisor.close()
+            self._supervisor = None
+        with self._exchange_lock:  # lets an exchange in progress on another thread finish first
+            if self.connected:
+                self.connected = False
+                self.transport.close()
+
+    def print_current_config(self, force=False):
+        """Prints the current config to console - used for user readability"""
+        self._cached_config(force)
+
+        config = self.config  # one snapshot, so the lines printed can't come from different configs
+        for field in FIELDS.values():
+            print("%s: %s" % (field.description, decode_setting(field.name, config[field.offset])))
+
+    def get_current_refresh_rate(self, force=False):
+        """Returns a RefreshRate named tuple containing the numerator and denominator to calculate the refresh rate,
+        the exact rate as a Fraction and whether the output is interlaced"""
+
+        self._cached_config(force)  # Make sure we have recent data
+        config = self.config
+        return REFRESH_RATES[(config.hd_standard, config.fps)]
+
+    def set_refresh_rate(self, rate, interlaced=False, lines=1080):
+        """Sets the HD standard and FPS that give the refresh rate in a single write, eg.
+        set_refresh_rate(Fraction(60000, 1001)) or set_refresh_rate(50, lines=720)
+
+        raises ValueError if no HD standard gives the rate, see refresh_rate_settings"""
+
+        hd_standard, fps = refresh_rate_settings(rate, interlaced, lines)
+        return self.apply(hd_standard=hd_standard, fps=fps)
+
+    def send_new_config_raw(self, new_config):
+        """Accepts a list of 20 values corresponding to each of the settings of the nanosyncs, or a NanoSyncConfig
+
+        Anything else, a config of the wrong length or with a byte the nanosyncs doesn't accept raises ValueError
+        without anything being sent. Only the settings that differ from the current config are checked when the
+        config is read back, raises ConfigWriteError if they are not seen within the retry_policy"""
+
+        new_config = self._raw_config(new_config)
+        changes = {field.name: new_config[field.offset] for field in FIELDS.values()}
+        return self._write_while_linked(lambda: self._send_config_now(new_config), changes)
+
+    def _send_config_now(self, new_config):
+        with self._exchange_lock:
+            # gets the latest state of the nanosync configuration
+            self._cached_config()
+            comparision = self.config
+
+            if not diff_configs(comparision, new_config):  # the cursor position alone is not worth a write
+                self._write_skipped()
+            else:
+                self._write_config(new_config)
+
+    def _write_while_linked(self, write, changes):
+        """Returns write(), unless the link is down or goes down during the write - then the change, a dict of
+        field -> byte, is handed to the supervisor, which queues it or raises LinkLostError as set by its outage"""
+
+        if self._supervisor is not None and self._supervisor.lost:
+            return self._supervisor.submit(changes)
+        try:
+            return write()
+        except LinkLostError:
+            supervisor = self._supervisor
+            if supervisor is None:
+                raise
+            return supervisor.submit(changes)
+
+    def _write_config(self, new_config, fields=None):
+        """Sends a full config to the nanosyncs and reads it back until the settings changed are seen, retrying as
+        set by retry_policy. Raises ConfigWriteError if they never are"""
+
+        policy = self.retry_policy
+        changed = self._changed_fields(new_config, fields)
+        start = time.perf_counter()
+        deadline = None if policy.deadline is None else time.monotonic() + policy.deadline
+
+        attempt = 0
+        while attempt < policy.max_attempts:
+            timeout = self.response_timeout
+            if attempt:
+                delay = policy.delay(attempt)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    break
+                time.sleep(delay)
+                if self.metrics is not None:
+                    self.metrics.retry(self.serial_number, attempt)
+            if deadline is not None:
+                timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+            if self._supervisor is not None:
+                self._supervisor.check()  # raises LinkLostError if an earlier attempt took the link down
+
+            attempt += 1
+            sent = time.monotonic()
+            try:
+                self._send_message(new_config.to_sysex())
+            except IOError:
+                if self._supervisor is not None:
+                    self._supervisor.check()  # a failed send takes the link down
+                raise
+            try:
+                self._get_current_config(timeout)
+            except LinkLostError:
+                raise
+            except IOError:
+                continue  # the write may still have landed, the next attempt reads it back
+            if self._write_landed(new_config, changed, start):
+                acked = time.monotonic()
+                self._write_latencies.append(acked - sent)
+                return sent, acked
+
+        raise self._write_failed(new_config, changed, attempt)
+
+    def apply(self, **fields):
+        """Changes several settings at once using a single config write, eg.
+        apply(hd_standard="720p x2 fps", fps="30 fps")
+
+        The latest config is read from the nanosyncs, every change is merged into it and the result is sent and
+        verified once, so the device never runs an intermediate combination of the settings.
+
+        In write behind mode nothing is sent straight away, a Future is returned that resolves to the config read back
+        after the merged write"""
+
+        self._merge_fields(fields)  # raises before anything is sent if a setting is invalid
+        changes = {field: encode_setting(field, setting) for field, setting in fields.items()}
+        if self._write_behind is not None and not (self._supervisor is not None and self._supervisor.lost):
+            return self._write_behind.submit(fields)
+        return self._write_while_linked(lambda: self._apply_now(fields), changes)
+
+    def _apply_now(self, fields):
+        # the read, merge and write are one exchange, so a change made by another thread in between can't be lost
+        with self._exchange_lock:
+            self._cached_config()
+            new_config = self._merge_fields(fields)
+
+            if new_config == self.config:
+                self._write_skipped()
+            else:
+                self._write_config(new_config, fields)
+
+    def recall(self, config):
+        """Writes a complete config, eg. a preset, as it is - without reading the current config first, and with every
+        setting checked when it is read back - so the change takes a single round trip
+
+        Raises ValueError for an invalid config and ConfigWriteError if the config is not seen within the
+        retry_policy"""
+
+        check_config(config)
+        if not isinstance(config, NanoSyncConfig):
+            config = NanoSyncConfig(config)
+        return self._write_while_linked(lambda: self._recall_now(config),
+                                        {field.name: config[field.offset] for field in FIELDS.values()})
+
+    def _recall_now(self, config):
+        with self._exchange_lock:
+            if not self.connected:
+                self.connect()
+            self._write_config(config, tuple(FIELDS))
+        return self.config
+
+    def schedule_apply(self, config, at, prepare=0.05):
+        """Makes a change land on the unit at a time.monotonic() deadline, eg. schedule_apply({"fps": "25 fps"},
+        at=time.monotonic() + 2) or schedule_apply(presets["film 23.98"], at=cue)
+
+        config is a dict of apply() keywords or a complete config. prepare seconds before the deadline the current
+        config is read and the change is merged and encoded, then the write is sent early by the one way delay to the
+        unit, estimated from the latest writes and their read backs, and nothing else is sent in between. Any number of changes can be
+        pending, they are run in order of their deadlines by one timer thread.
+
+        Returns a Future that resolves to a LandingReport, cancelling it before its deadline drops the change"""
+
+        # raises before anything is scheduled if a setting is invalid
+        if isinstance(config, dict):
+            self._merge_fields(config)
         else:
-            print("invalid setting has been given for AES multiplier")
-
-    def set_SPDIF_multiplier(self, setting):
-        
-        if setting in ["x1", "x2"]:
-            self.SPDIF_multiplier_setting = self.SPDIF_multiplier[setting]
-            self._update_current_config()
-            self.send_new_config_raw(self.current_config)
-            print("set SPDIF multiplier to %s " % setting)
+            check_config(config)
+            if not isinstance(config, NanoSyncConfig):
+                config = NanoSyncConfig(config)
+        if self._scheduler is None:
+            self._scheduler = _Scheduler(self)
+        return self._scheduler.submit(config, at, prepare)
+
+    def _landing_delay(self, default=0.0):
+        """Estimated seconds from sending a config write to the unit applying it - the median time from a write to the
+        read back confirming it, less the median round trip of a config query as the read back is one"""
+
+        if not self._write_latencies:
+            return default
+        return max(0.0, _median(self._write_latencies) - _median(self._query_latencies))
+
+    def _land(self, change, at):
+        """Writes a scheduled change so that it lands at the deadline, returns a LandingReport"""
+
+        with self._exchange_lock:
+            if not self.connected:
+                self.connect()
+
+            self._get_current_config()
+            query_time = self._query_latencies[-1]
+
+            if isinstance(change, dict):
+                new_config, fields = self._merge_fields(change), tuple(change)
+            else:
+                new_config, fields = change, tuple(FIELDS)
+            new_config.to_sysex()
+
+            # until there are writes to go by a query round trip is the best estimate
+            send_at = at - self._landing_delay(query_time / 2)
+            if send_at - time.monotonic() > 0.001:
+                time.sleep(send_at - time.monotonic() - 0.001)
+            while time.monotonic() < send_at:
+                pass  # the last millisecond is spun, sleeping overshoots by more than that
+
+            sent, acked = self._write_config(new_config, fields)
+
+        landed = max(sent, acked - _median(self._query_latencies))
+        return LandingReport(at, sent, landed, acked, landed - at, self.config)
+
+    def transaction(self):
+        """Returns a context manager that collects setting changes and applies them in one write on exit, eg.
+
+        with sync.transaction() as t:
+            t.hd_standard = "720p x2 fps"
+            t.fps = "30 fps"
+        """
+        return NanoSyncTransaction(self)
+
+    def watch(self, callback=None, min_interval=0.05, max_interval=2.0, poll=True):
+        """Returns a ConfigWatcher that reports changes to the config, eg. made on the front panel of the unit
+
+        Each change is a list of SettingChange(field, old label, new label) and is passed to callback, if given, and
+        to anything iterating over the watcher. Configs the unit sends by itself are used as they arrive, otherwise
+        it is polled - every min_interval seconds after a change, backing off to max_interval while nothing changes"""
+
+        watcher = ConfigWatcher(self, min_interval, max_interval, poll)
+        if callback is not None:
+            watcher.subscribe(callback)
+        return watcher
+
+    def supervise(self, outage="reject", scan_interval=0.1, max_timeouts=3):
+        """Starts a ConnectionSupervisor that reconnects to the same unit in the background when the link is lost
+
+        During an outage queries raise LinkLostError, changes raise it too with outage="reject" and are queued and
+        written after the reconnect with outage="queue" """
+
+        if self._supervisor is None:
+            self._supervisor = ConnectionSupervisor(self, outage, scan_interval, max_timeouts)
+        return self._supervisor
+
+    def enable_write_behind(self, debounce=0.05):
+        """Queues changes from apply() and the setters instead of writing them straight away
+
+        Changes made within debounce seconds of the first queued one are merged and written together by a background
+        worker, so a burst of setter calls costs one write and the device never runs the intermediate states"""
+
+        if self._write_behind is None:
+            self._write_behind = _WriteBehind(self, debounce)
         else:
-            print("invalid setting has been given for SPDIF multiplier")
+            self._write_behind.debounce = debounce
+
+    def disable_write_behind(self):
+        """Writes anything still queued and goes back to writing every change straight away"""
+
+        if self._write_behind is not None:
+            self._write_behind.close()
+            self._write_behind = None
+
+    def flush(self, timeout=None):
+        """Waits until every queued change has been written, returns immediately without write behind"""
+
+        if self._write_behind is not None:
+            self._write_behind.flush(timeout)
+
+
+class ConfigWatcher:
+    """Streams the setting changes seen on a NanoSync to callbacks, iterators and async iterators
+
+    with sync.watch(print) as watcher:       # callback
+        for changes in watcher:             # or iterate, blocks until the next change
+            ...
+    async for changes in sync.watch():      # or from a coroutine
+        ...
+    """
+
+    def __init__(self, nanosync, min_interval=0.05, max_interval=2.0, poll=True):
+        import queue
+
+        self.nanosync = nanosync
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.poll = poll
+
+        self._callbacks = []
+        self._streams = []   # put functions of the iterators, None is put when the watcher closes
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._closed = threading.Event()
+
+        # changes are queued by whichever thread stored the config, eg. the transport callback or a thread writing
+        # under the exchange lock, and handed on from the watcher thread so a slow receiver never holds them up
+        self._queue = queue.Queue()
+
+        nanosync._watchers.append(self)
+        self._thread = threading.Thread(target=self._run, name="nanosyncs watcher", daemon=True)
+        self._thread.start()
+
+    def subscribe(self, callback):
+        """callback(changes) is called from the watcher thread with a list of SettingChange"""
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._callbacks.remove(callback)
+
+    def _notify(self, changes):
+        self._changed.set()
+        self._queue.put(changes)
+
+    def _run(self):
+        """Hands queued changes to the callbacks and iterators, and polls the nanosyncs in between if poll is set"""
+
+        import queue
+        import traceback
+
+        interval = self.min_interval
+        next_poll = time.monotonic() + interval
+        while True:
+            try:
+                changes = self._queue.get(timeout=max(0.0, next_poll - time.monotonic()) if self.poll else None)
+            except queue.Empty:
+                self._changed.clear()
+                try:
+                    self.nanosync.refresh()
+                except IOError:
+                    pass  # a missed reply is treated like an unchanged config
+                # poll quickly while things are changing, back off while the config is stable
+                if self._changed.is_set():
+                    interval = self.min_interval
+                else:
+                    interval = min(interval * 2, self.max_interval)
+                next_poll = time.monotonic() + interval
+                continue
+
+            if changes is None:
+                return  # closed
+            with self._lock:
+                receivers = self._callbacks + self._streams
+            for receiver in receivers:
+                try:
+                    receiver(changes)
+                except Exception:
+                    traceback.print_exc()  # one failing callback doesn't stop the others or the watcher
+
+    def __iter__(self):
+        import queue
+
+        changes_queue = queue.Queue()
+        with self._lock:
+            if self._closed.is_set():
+                return
+            self._streams.append(changes_queue.put)
+        try:
+            while True:
+                changes = changes_queue.get()
+                if changes is None:
+                    return
+                yield changes
+        finally:
+            with self._lock:
+                self._streams.remove(changes_queue.put)
+
+    async def __aiter__(self):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        changes_queue = asyncio.Queue()
+
+        def put(changes):
+            loop.call_soon_threadsafe(changes_queue.put_nowait, changes)
+
+        with self._lock:
+            if self._closed.is_set():
+                return
+            self._streams.append(put)
+        try:
+            while True:
+                changes = await changes_queue.get()
+                if changes is None:
+                    return
+                yield changes
+        finally:
+            with self._lock:
+                self._streams.remove(put)
+
+    def close(self):
+        """Stops polling and ends every iteration over the watcher"""
+
+        self._closed.set()
+        if self in self.nanosync._watchers:
+            self.nanosync._watchers.remove(self)
+        self._queue.put(None)  # the changes already queued are handed on first
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        with self._lock:
+            streams = list(self._streams)
+        for put in streams:
+            put(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _WriteBehind:
+    """Merges queued changes for a NanoSync and writes the latest state once per debounce window"""
+
+    def __init__(self, nanosync, debounce):
+        self.nanosync = nanosync
+        self.debounce = debounce
+
+        self._pending = {}       # apply() keyword -> latest setting label
+        self._futures = []       # futures of the callers whose changes are in _pending
+        self._deadline = None    # when _pending is written, debounce seconds after the first change was queued
+        self._writing = False
+        self._closed = False
+        self._changed = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="nanosyncs write behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, fields):
+        from concurrent.futures import Future
+
+        future = Future()
+        with self._changed:
+            if self._closed:
+                raise IOError("write behind has been stopped")
+            if self._deadline is None:
+                self._deadline = time.monotonic() + self.debounce
+            self._pending.update(fields)
+            self._futures.append(future)
+            self._changed.notify_all()
+        return future
+
+    def flush(self, timeout=None):
+        with self._changed:
+            if self._pending:
+                self._deadline = time.monotonic()  # no need to wait out the window
+                self._changed.notify_all()
+            if not self._changed.wait_for(lambda: not self._pending and not self._writing, timeout):
+                raise IOError("queued nanosyncs changes were not written within %s seconds" % timeout)
+
+    def close(self):
+        self.flush()
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._changed:
+                while not self._closed and (self._deadline is None or time.monotonic() < self._deadline):
+                    self._changed.wait(None if self._deadline is None else self._deadline - time.monotonic())
+                if self._closed:
+                    return
+                fields, futures = self._pending, self._futures
+                self._pending, self._futures, self._deadline = {}, [], None
+                self._writing = True
+
+            try:
+                self.nanosync._apply_now(fields)
+            except LinkLostError as error:
+                # with outage="queue" the supervisor writes the change after the reconnect and resolves the futures
+                supervisor = self.nanosync._supervisor
+                if supervisor is not None and supervisor.outage == "queue":
+                    supervisor.submit({field: encode_setting(field, setting) for field, setting in fields.items()},
+                                      futures)
+                else:
+                    for future in futures:
+                        future.set_exception(error)
+            except Exception as error:
+                for future in futures:
+                    future.set_exception(error)
+            else:
+                for future in futures:
+                    future.set_result(self.nanosync.config)
+
+            with self._changed:
+                self._writing = False
+                self._changed.notify_all()
+
+
+class ConnectionSupervisor:
+    """Reconnects a NanoSync to the same unit in the background after its link is lost, eg. the usb cable was pulled
+
+    The link is lost when the unit's ports disappear, when a frame can't be sent or after max_timeouts queries in a
+    row got no reply. The ports are then scanned every scan_interval seconds, the ports the unit was last seen on
+    first, and the first unit answering with the same serial number is reconnected to.
+
+    While the link is down queries raise LinkLostError. Changes do as well with outage="reject", with
+    outage="queue" they are merged and a Future is returned that resolves to the config read back once the change
+    has been written after the reconnect"""
+
+    def __init__(self, nanosync, outage="reject", scan_interval=0.1, max_timeouts=3):
+
+        if outage not in ("reject", "queue"):
+            raise ValueError("outage has to be reject or queue, not %r" % outage)
+        self.nanosync = nanosync
+        self.outage = outage
+        self.scan_interval = scan_interval
+        self.max_timeouts = max_timeouts
+
+        self.lost = False
+        self.outages = 0       # number of times the link was lost
+        self._timeouts = 0     # queries in a row without a reply
+        self._pending = {}     # field -> byte of the changes queued during an outage
+        self._futures = []
+        self._wake = threading.Condition()
+        self._closed = False
+
+        # port names that answered with another serial number, not tried again until the ports listed change
+        self._listing = None
+        self._other_units = set()
+
+        self._thread = threading.Thread(target=self._run, name="nanosyncs supervisor", daemon=True)
+        self._thread.start()
+
+    def check(self):
+        """Raises LinkLostError while the link is down, except on the supervisor's own thread"""
+
+        if self.lost and threading.current_thread() is not self._thread:
+            raise LinkLostError("the link to nanosyncs %s is down, reconnecting" % self.nanosync.serial_number)
+
+    def exchange_succeeded(self):
+        self._timeouts = 0
+
+    def exchange_failed(self, error):
+        """Called with the IOError a query raised, decides whether the link is lost"""
+
+        if self.lost or threading.current_thread() is self._thread:
+            return  # already lost, eg. the send failed, or a failed reconnect attempt and the scan carries on
+        self._timeouts += 1
+        if self._timeouts >= self.max_timeouts or not self._ports_present():
+            self._lose()
+
+    def send_failed(self):
+        """Called when a frame couldn't be sent, the link is lost straight away"""
+
+        if threading.current_thread() is not self._thread:
+            self._lose()
+
+    def submit(self, fields, futures=None):
+        """Queues changes, a dict of field -> byte, made while the link is down
+
+        Returns a Future that resolves once the change is written, or resolves the futures given instead, eg. the ones
+        write behind handed out for the change"""
+
+        if self.outage == "reject":
+            self.check()
+        from concurrent.futures import Future
+
+        future = None
+        if futures is None:
+            future = Future()
+            futures = [future]
+        with self._wake:
+            self._pending.update(fields)
+            self._futures.extend(futures)
+            if not self.lost:
+                self._wake.notify()  # the link came back while the change was on its way here
+        return future
+
+    def _ports_present(self):
+        nanosync = self.nanosync
+        try:
+            in_names, out_names = nanosync.transport.list_ports()
+        except Exception:
+            return False
+        return nanosync.midi_in_name in in_names and nanosync.midi_out_name in out_names
+
+    def _lose(self):
+        nanosync = self.nanosync
+        with self._wake:
+            if self.lost or self._closed:
+                return
+            self.lost = True
+            self.outages += 1
+            self._wake.notify()
+
+        print("lost the link to nanosyncs %s, reconnecting" % nanosync.serial_number)
+        with nanosync._exchange_lock:
+            if nanosync.connected:
+                nanosync.connected = False
+                try:
+                    nanosync.transport.close()
+                except Exception:
+                    pass  # the port may already be gone
+
+    def _run(self):
+        while True:
+            with self._wake:
+                if not self._pending or self.lost:
+                    self._wake.wait(self.scan_interval)
+                if self._closed:
+                    return
+                lost, pending = self.lost, bool(self._pending)
+
+            if not lost:
+                if pending:
+                    self._flush()
+                elif self.nanosync.connected and not self._ports_present():
+                    self._lose()
+            elif self._reconnect():
+                self._flush()
+
+    def _candidates(self):
+        """Port pairs to try as (in port, out port, names), the ones with the names the unit was last seen on first"""
+
+        nanosync = self.nanosync
+        in_names, out_names = nanosync.transport.list_ports()
+        if (in_names, out_names) != self._listing:
+            self._listing = (in_names, out_names)
+            self._other_units.clear()
+
+        candidates = [(in_port, out_port, (in_names[in_port], out_names[out_port]))
+                      for in_port, out_port in find_nanosync_ports(nanosync.transport)]
+        names = (nanosync.midi_in_name, nanosync.midi_out_name)
+        if names[0] in in_names and names[1] in out_names:
+            cached = (in_names.index(names[0]), out_names.index(names[1]), names)
+            candidates = [cached] + [pair for pair in candidates if pair != cached]
+        return [pair for pair in candidates if pair[2] not in self._other_units]
+
+    def _reconnect(self):
+        """Tries every candidate port pair once, returns True when connected to the same unit again
+
+        Each unit found is only asked for its serial number, its config is read once it is known to be the same unit"""
+
+        nanosync = self.nanosync
+        try:
+            candidates = self._candidates()
+        except Exception:
+            return False
+
+        for in_port, out_port, names in candidates:
+            nanosync.midi_in_port, nanosync.midi_out_port = in_port, out_port
+            try:
+                nanosync.connect(expected_serial=nanosync.serial_number)
+            except WrongUnitError:
+                self._other_units.add(names)  # another unit, eg. the second one of a fleet
+                continue
+            except IOError:
+                continue
+            self._timeouts = 0
+            print("reconnected to nanosyncs %s" % nanosync.serial_number)
+            return True
+        return False
+
+    def _flush(self):
+        """Writes the changes queued during the outage and marks the link as up"""
+
+        nanosync = self.nanosync
+        while True:
+            with self._wake:
+                pending, futures = self._pending, self._futures
+                self._pending, self._futures = {}, []
+                if not pending:
+                    self.lost = False
+                    return
+
+            try:
+                with nanosync._exchange_lock:
+                    new_config = nanosync.config.replace(**pending)
+                    if new_config != nanosync.config:
+                        nanosync._write_config(new_config, tuple(pending))
+            except Exception as error:
+                for future in futures:
+                    future.set_exception(error)
+            else:
+                for future in futures:
+                    future.set_result(nanosync.config)
+
+    def close(self):
+        """Stops supervising, changes still queued fail with LinkLostError"""
+
+        with self._wake:
+            self._closed = True
+            futures, self._futures, self._pending = self._futures, [], {}
+            self._wake.notify()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        for future in futures:
+            future.set_exception(LinkLostError("stopped supervising nanosyncs %s" % self.nanosync.serial_number))
+
+
+class _Scheduler:
+    """Runs the changes passed to NanoSync.schedule_apply from one timer thread, in order of their deadlines"""
+
+    def __init__(self, nanosync):
+        self.nanosync = nanosync
+        self._pending = []    # heap of (deadline, sequence, change, prepare, future)
+        self._sequence = 0
+        self._changed = threading.Condition()
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name="nanosyncs scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, change, at, prepare):
+        import heapq
+        from concurrent.futures import Future
+
+        future = Future()
+        with self._changed:
+            heapq.heappush(self._pending, (at, self._sequence, change, prepare, future))
+            self._sequence += 1
+            self._changed.notify()
+        return future
+
+    def close(self):
+        """Stops the timer thread, changes that have not started are cancelled"""
+
+        with self._changed:
+            self._closed = True
+            pending, self._pending = self._pending, []
+            self._changed.notify()
+        self._thread.join()
+        for at, sequence, change, prepare, future in pending:
+            future.cancel()
+
+    def _wake_time(self):
+        at, sequence, change, prepare, future = self._pending[0]
+        return at - self.nanosync._landing_delay() - prepare
+
+    def _run(self):
+        import heapq
+
+        while True:
+            with self._changed:
+                while not self._closed and (not self._pending or time.monotonic() < self._wake_time()):
+                    self._changed.wait(self._wake_time() - time.monotonic() if self._pending else None)
+                if self._closed:
+                    return
+                at, sequence, change, prepare, future = heapq.heappop(self._pending)
+
+            if not future.set_running_or_notify_cancel():
+                continue  # cancelled by the caller
+            try:
+                future.set_result(self.nanosync._land(change, at))
+            except Exception as error:
+                future.set_exception(error)
+
+
+def _make_setter(field):
+    def setter(self, setting):
+        queued = self.apply(**{field.name: setting})
+        if queued is not None:
+            return queued  # write behind, the Future resolves once the merged write is done
+        print("set %s to %s " % (field.description, setting))
+    setter.__name__ = "set_" + field.name
+    setter.__doc__ = "Sets %s to one of %s, raises ValueError for an invalid setting" % (field.description, list(field.table))
+    return setter
+
+
+for _field in FIELDS.values():
+    setattr(NanoSync, "set_" + _field.name, _make_setter(_field))
+
+
+class NanoSyncTransaction:
+    """Collects setting changes made inside a `with` block and sends them to the nanosyncs as a single config"""
+
+    def __init__(self, nanosync):
+        object.__setattr__(self, "_nanosync", nanosync)
+        object.__setattr__(self, "_changes", {})
+
+    def __setattr__(self, field, setting):
+        self._nanosync._check_setting(field, setting)  # fail at the assignment rather than on exit
+        self._changes[field] = setting
+
+    def __getattr__(self, field):
+        if field in self._changes:
+            return self._changes[field]
+        raise AttributeError("%s has not been changed in this transaction" % field)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # nothing is sent if the block raised
+        if exc_type is None and self._changes:
+            self._nanosync.apply(**self._changes)
+
 
-    def get_video_ref(self):
-        return self.video_ref.inverse[self.video_ref_setting]
+class AsyncNanoSync(_NanoSyncBase):
+    """asyncio front end for the nanosyncs - queries and setters are coroutines so the event loop is never blocked
+
+    sync = AsyncNanoSync()
+    await sync.connect()
+    await sync.apply(hd_standard="720p x2 fps", fps="30 fps")
+    await sync.set_fps("25 fps")
+    """
+
+    def __init__(self, timeout=0.5, transport=None, in_port=None, out_port=None, serial_number=None, metrics=None,
+                 retry_policy=None):
+        super().__init__(transport, in_port, out_port, serial_number, metrics, retry_policy)
+
+        self.response_timeout = timeout  # seconds to wait for a reply before raising an IOError
+        self._loop = None
+        self._waiting = {}               # command byte -> future resolved by the reply with that command byte
+        self._exchange_lock = None       # only one query / write is on the midi bus at a time
+
+    async def connect(self):
+        """Opens the midi ports, reads the serial number and firmware version and then the current config"""
+
+        import asyncio
 
-    def get_video_standard(self):
-        return self.video_standard.inverse[self.video_standard_setting]
+        self._loop = asyncio.get_running_loop()
+        self._exchange_lock = asyncio.Lock()
 
-    def get_hd_standard(self):
-        return self.HD_standard.inverse[self.HD_standard_setting]
+        self._open_transport(self._on_frame)
 
-    def get_fps(self):
-        return self.FPS.inverse[self.FPS_setting]
+        async with self._exchange_lock:
+            try:
+                self._store_info(await self._request(SERIAL_QUERY_FRAME))
+            except Exception:
+                if self.metrics is not None:
+                    self._record_held(self.serial_number or self.midi_in_name)
+                raise
+        await self.get_config()
 
-    def get_sdi_out_1_to_3(self):
-        return self.video_definition.inverse[self.video_1_to_3_setting]
+    def disconnect(self):
+        self.transport.close()
+
+    def _on_frame(self, message):
+        """Transport callback - runs on the transport's thread so the frame is handed over to the event loop"""
+
+        if len(message) < 6 or message[:4] != SYSEX_HEADER:
+            return  # not a nanosyncs system exclusive message
+        if self.metrics is not None:
+            self._record("frame_received", message[4])
+        self._loop.call_soon_threadsafe(self._resolve, message)
+
+    def _resolve(self, message):
+        future = self._waiting.pop(message[4], None)
+        if future is not None and not future.done():
+            future.set_result(message)
+
+    async def _request(self, frame, timeout=None):
+        """Sends a query frame to the nanosyncs and waits for the reply with the same command byte"""
+
+        import asyncio
+
+        if timeout is None:
+            timeout = self.response_timeout
+
+        command = frame[4]
+        future = self._loop.create_future()
+        self._waiting[command] = future
+        start = time.perf_counter()
+        self._send_message(frame)
+        try:
+            message = await asyncio.wait_for(future, timeout)
+            if self.metrics is not None:
+                self._record("exchange", command, time.perf_counter() - start)
+            return message
+        except asyncio.TimeoutError:
+            if self.metrics is not None:
+                self._record("timeout", command, timeout)
+            raise IOError("did not receive message from Nanosync within %s seconds" % timeout)
+        finally:
+            if self._waiting.get(command) is future:
+                del self._waiting[command]
+
+    async def _get_current_config(self, timeout=None):
+        received_config = await self._request(CONFIG_QUERY_FRAME, timeout)
+        self._store_config(received_config[5:-1])  # Strips the midi system exclusive header and footer
+
+    async def get_config(self):
+        """Reads the current config from the nanosyncs and returns it as a NanoSyncConfig"""
+
+        async with self._exchange_lock:
+            await self._get_current_config()
+        return self.config
+
+    async def _write_config(self, new_config, fields=None):
+        """Sends a full config to the nanosyncs and reads it back until the settings changed are seen, see
+        NanoSync._write_config"""
+        import asyncio
+
+        policy = self.retry_policy
+        changed = self._changed_fields(new_config, fields)
+        start = time.perf_counter()
+        deadline = None if policy.deadline is None else time.monotonic() + policy.deadline
+
+        attempt = 0
+        while attempt < policy.max_attempts:
+            timeout = self.response_timeout
+            if attempt:
+                delay = policy.delay(attempt)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    break
+                await asyncio.sleep(delay)
+                if self.metrics is not None:
+                    self.metrics.retry(self.serial_number, attempt)
+            if deadline is not None:
+                timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+
+            attempt += 1
+            self._send_message(new_config.to_sysex())
+            try:
+                await self._get_current_config(timeout)
+            except IOError:
+                continue  # the write may still have landed, the next attempt reads it back
+            if self._write_landed(new_config, changed, start):
+                return
+
+        raise self._write_failed(new_config, changed, attempt)
+
+    async def apply(self, **fields):
+        """Changes several settings at once using a single config write, see NanoSync.apply"""
+
+        self._merge_fields(fields)  # raises before anything is sent if a setting is invalid
+        async with self._exchange_lock:
+            await self._get_current_config()
+            new_config = self._merge_fields(fields)
+            if new_config == self.config:
+                self._write_skipped()
+            else:
+                await self._write_config(new_config, fields)
+
+
+class NanoSyncFleet:
+    """Controls every connected nanosyncs in parallel, each unit is identified by its serial number
 
-    def get_sdi_out_4(self):
-        return self.video_definition.inverse[self.video_4_setting]
+    fleet = NanoSyncFleet()
+    fleet.apply(fps="25 fps")   # every unit is switched at the same time
+    fleet["1234"].print_current_config()
 
-    def get_sdi_out_5(self):
-        return self.video_definition.inverse[self.video_5_setting]
+    A NanoSyncMetrics given as metrics is shared by every unit. A unit that can't be connected to is left out of the
+    fleet and the exception is kept in errors, an IOError is only raised if no unit could be connected to
+    """
 
-    def get_sdi_out_6(self):
-        return self.video_definition.inverse[self.video_6_setting]
+    def __init__(self, timeout=0.5, transport_factory=MidiTransport, metrics=None):
+
+        # every unit gets its own transport, transport_factory() is called once per unit plus once to list the ports
+        listing = transport_factory()
+        in_names, out_names = listing.list_ports()
+        port_pairs = find_nanosync_ports(listing)
+        if not port_pairs:
+            raise IOError("unable to find any nano sync midi ports")
+
+        # one worker per unit so that every exchange runs at the same time
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._executor = ThreadPoolExecutor(max_workers=len(port_pairs))
+        connecting = [self._executor.submit(NanoSync, timeout, *ports, transport=transport_factory(), metrics=metrics)
+                      for ports in port_pairs]
+
+        # a unit that fails to connect is left out, the exception it raised is kept in errors under its port names
+        self.devices = {}   # serial number -> NanoSync
+        self.errors = {}    # (in port name, out port name) -> exception
+        for (in_port, out_port), future in zip(port_pairs, connecting):
+            try:
+                nanosync = future.result()
+            except Exception as error:
+                self.errors[(in_names[in_port], out_names[out_port])] = error
+            else:
+                self.devices[nanosync.serial_number] = nanosync
 
-    def get_audio_ref(self):
-        return self.audio_ref.inverse[self.audio_ref_setting]
+        if not self.devices:
+            self._executor.shutdown()
+            raise IOError("unable to connect to any nanosyncs: %s" % "; ".join(map(str, self.errors.values())))
 
-    def get_external_word_fs(self):
-        return self.external_word_fs.inverse[self.external_word_fs_setting]
+    def __getitem__(self, serial_number):
+        return self.devices[serial_number]
 
-    def get_external_word_fs_multiplier(self):
-        return self.external_word_fs_multiplier.inverse[self.external_word_fs_multiplier_setting]
+    def __iter__(self):
+        return iter(self.devices)
 
-    def get_external_word_fs_modifier(self):
-        return self.external_word_fs_modifier.inverse[self.external_word_fs_modifier_setting]
+    def __len__(self):
+        return len(self.devices)
 
-    def get_external_LTC_fps(self):
-        return self.external_LTC_fps.inverse[self.external_LTC_fps_setting]
+    def run(self, function):
+        """Calls function(nanosync) for every unit at the same time and returns a dict of serial number -> result
 
-    def get_audio_sample_rate(self):
-        return self.audio_sample_rate.inverse[self.audio_sample_rate_setting]
+        If the call fails on a unit the exception it raised is returned as the result for that unit"""
 
-    def get_audio_sample_rate_modifier(self):
-        return self.audio_sample_rate_modifier.inverse[self.audio_sample_rate_modifier_setting]
+        def call(nanosync):
+            try:
+                return function(nanosync)
+            except Exception as error:
+                return error
+
+        futures = {serial: self._executor.submit(call, nanosync) for serial, nanosync in self.devices.items()}
+        return {serial: future.result() for serial, future in futures.items()}
+
+    def get_configs(self):
+        """Reads the current config of every unit, returns a dict of serial number -> NanoSyncConfig"""
+
+        return self.run(lambda nanosync: nanosync.get_config(force=True))
+
+    def apply(self, **fields):
+        """Applies the same settings to every unit, see NanoSync.apply
+
+        Returns a dict of serial number -> config read back from the unit, or the exception raised for that unit"""
+
+        def apply(nanosync):
+            nanosync.apply(**fields)
+            return nanosync.config
+
+        return self.run(apply)
+
+    def disconnect(self):
+        for nanosync in self.devices.values():
+            nanosync.disconnect()
+        self._executor.shutdown()
 
-    def get_word_multiplier_1_6(self):
-        return self.word_multiplier_1_6.inverse[self.word_multiplier_1_6_setting]
 
-    def get_word_multiplier_7_8(self):
-        return self.word_multiplier_7_8.inverse[self.word_multiplier_7_8_setting]
+def _make_async_setter(field):
+    async def setter(self, setting):
+        await self.apply(**{field.name: setting})
+    setter.__name__ = "set_" + field.name
+    setter.__doc__ = "Sets %s to one of %s, raises ValueError for an invalid setting" % (field.description, list(field.table))
+    return setter
 
-    def get_AES_multiplier(self):
-        return self.AES_multiplier.inverse[self.AES_multiplier_setting]
 
-    def get_SPDIF_multiplier(self):
-        return self.SPDIF_multiplier.inverse[self.SPDIF_multiplier_setting]
+# the awaitable setters mirror the NanoSync ones, eg. await sync.set_fps("25 fps")
+for _field in FIELDS.values():
+    setattr(AsyncNanoSync, "set_" + _field.name, _make_async_setter(_field))
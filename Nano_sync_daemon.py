@@ -0,0 +1,345 @@
+"""Local daemon that owns the connection to a nanosyncs and shares it with any number of client processes
+
+A midi port can only be used by one process at a time, so instead of every script opening the ports and repeating the
+handshake the daemon keeps one NanoSync connected and serves get, apply and watch requests over a local socket
+
+    python Nano_sync_daemon.py --max-age 1.0
+
+NanoSyncClient has the same getters, setters and apply() as NanoSync
+
+    from Nano_sync_daemon import NanoSyncClient
+
+    sync = NanoSyncClient()
+    sync.set_fps("25 fps")
+
+Requests and replies are compact JSON objects, one per line. A request has an id, an op and its arguments, eg.
+{"id":1,"op":"apply","fields":{"fps":"25 fps"}}, and is answered with the same id and the config after the request
+{"id":1,"config":[...]} or with {"id":1,"error":"ValueError","message":"..."}. A connection that sent a watch request
+also gets {"event":"changes","changes":[[field,old,new],...],"config":[...]} for every change seen on the unit
+"""
+import os
+import sys
+import json
+import socket
+import argparse
+import tempfile
+import itertools
+import threading
+import socketserver
+
+from Nano_sync_control import (NanoSync, NanoSyncConfig, SettingChange, ConfigWriteError, ConfigWatcher, FIELDS,
+                               _NanoSyncBase)
+
+# a unix socket where there are unix sockets, otherwise a port on the loopback interface
+if hasattr(socket, "AF_UNIX"):
+    DEFAULT_ADDRESS = os.path.join(tempfile.gettempdir(), "nanosync.sock")
+else:
+    DEFAULT_ADDRESS = ("127.0.0.1", 47400)
+
+
+def _encode(message):
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def _family(address):
+    return socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+
+
+class _Connection(socketserver.StreamRequestHandler):
+    """One client connection - requests are handled in order, change events can be sent in between"""
+
+    def setup(self):
+        super().setup()
+        self._write_lock = threading.Lock()
+
+    def send(self, message):
+        with self._write_lock:
+            self.wfile.write(_encode(message))
+            self.wfile.flush()
+
+    def handle(self):
+        daemon = self.server.nanosync_daemon
+        try:
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    continue  # not a request, there is no id to answer to
+                self.send(daemon.handle(request, self))
+        except (ConnectionError, OSError):
+            pass  # the client went away
+        finally:
+            daemon.stop_watching(self)
+
+
+class NanoSyncDaemon:
+    """Serves one NanoSync to local clients, see the module docstring for the protocol
+
+    Requests from different clients are handled at the same time. NanoSync makes its exchanges with the unit one at a
+    time, so writes never interleave, while a read answered from its cache doesn't wait for another client's write"""
+
+    def __init__(self, nanosync, address=DEFAULT_ADDRESS):
+
+        self.nanosync = nanosync
+        self.address = address
+        self._watcher = None      # ConfigWatcher on the nanosync, created for the first client that watches
+        self._watching = set()    # connections that get change events
+        self._watching_lock = threading.Lock()
+
+        if isinstance(address, tuple):
+            base = socketserver.ThreadingTCPServer
+        else:
+            base = socketserver.ThreadingUnixStreamServer
+            self._remove_stale_socket(address)
+
+        class Server(base):
+            daemon_threads = True        # a client that never disconnects doesn't keep the daemon running
+            allow_reuse_address = True
+
+        self.server = Server(address, _Connection)
+        self.server.nanosync_daemon = self
+
+    @staticmethod
+    def _remove_stale_socket(path):
+        if not os.path.exists(path):
+            return
+        probe = socket.socket(socket.AF_UNIX)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)  # left behind by a daemon that has stopped
+        else:
+            raise IOError("a nanosync daemon is already listening on %s" % path)
+        finally:
+            probe.close()
+
+    def handle(self, request, connection):
+        """Returns the reply to a request"""
+
+        reply = {"id": request.get("id")}
+        op = request.get("op")
+        try:
+            if op == "get":
+                self.nanosync.get_config(force=request.get("force", False))
+            elif op == "apply":
+                self.nanosync.apply(**request.get("fields", {}))
+            elif op == "raw":
+                self.nanosync.send_new_config_raw(list(request["config"]))
+            elif op == "info":
+                reply["serial_number"] = self.nanosync.serial_number
+                reply["firmware_version"] = self.nanosync.firmware_version
+            elif op == "watch":
+                self.start_watching(connection)
+            else:
+                raise ValueError("unknown op %r" % op)
+            reply["config"] = list(self.nanosync.config)
+        except ConfigWriteError as error:
+            reply.update(error="ConfigWriteError", message=str(error), expected=list(error.expected),
+                         observed=list(error.observed), fields=list(error.fields), attempts=error.attempts)
+        except Exception as error:
+            reply.update(error=type(error).__name__, message=str(error))
+        return reply
+
+    def start_watching(self, connection):
+        with self._watching_lock:
+            self._watching.add(connection)
+            if self._watcher is None:
+                self._watcher = self.nanosync.watch(self._broadcast)
+
+    def stop_watching(self, connection):
+        with self._watching_lock:
+            self._watching.discard(connection)
+
+    def _broadcast(self, changes):
+        """Sends a change event to every watching client, called from the watcher thread so a slow client never holds
+        up an exchange with the unit"""
+
+        event = {"event": "changes", "changes": [list(change) for change in changes],
+                 "config": list(self.nanosync.config)}
+        with self._watching_lock:
+            connections = list(self._watching)
+        for connection in connections:
+            try:
+                connection.send(event)
+            except OSError:
+                self.stop_watching(connection)
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def shutdown(self):
+        """Stops serving and disconnects the nanosyncs, can be called from any thread but the serving one"""
+
+        self.server.shutdown()
+        self.server.server_close()
+        if self._watcher is not None:
+            self._watcher.close()
+        self.nanosync.disconnect()
+        if not isinstance(self.address, tuple) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+class NanoSyncClient(_NanoSyncBase):
+    """Talks to a NanoSyncDaemon, with the same getters, setters, apply(), get_config() and watch() as NanoSync
+
+    The config is refreshed from every reply the daemon sends, so the getters return the state after the last request"""
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=5.0):
+        super().__init__()
+
+        self.address = address
+        self.response_timeout = timeout    # seconds to wait for the daemon, which may itself be waiting on the unit
+        self._ids = itertools.count(1)
+        self._responses = {}               # request id -> reply, None while the request is waiting
+        self._response_received = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._watchers = []
+        self._watching = False
+        self.connected = False
+
+        self._socket = socket.socket(_family(address))
+        self._socket.connect(address)
+        self._file = self._socket.makefile("rb")
+        self.connected = True
+        self._reader = threading.Thread(target=self._read, name="nanosync client", daemon=True)
+        self._reader.start()
+
+        info = self._call("info")
+        self.serial_number = info["serial_number"]
+        self.firmware_version = info["firmware_version"]
+
+    def _read(self):
+        try:
+            for line in self._file:
+                message = json.loads(line)
+                if "config" in message:
+                    self.config = NanoSyncConfig(message["config"])
+                if message.get("event") == "changes":
+                    changes = [SettingChange(*change) for change in message["changes"]]
+                    for watcher in list(self._watchers):
+                        watcher._notify(changes)
+                    continue
+                with self._response_received:
+                    self._responses[message["id"]] = message
+                    self._response_received.notify_all()
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._response_received:
+                self.connected = False
+                self._response_received.notify_all()
+
+    def _call(self, op, **arguments):
+        """Sends a request to the daemon and returns its reply, raising the error the daemon reported if there was one"""
+
+        request_id = next(self._ids)
+        with self._response_received:
+            if not self.connected:
+                raise IOError("not connected to the nanosync daemon at %s" % (self.address,))
+            self._responses[request_id] = None
+        with self._send_lock:
+            self._socket.sendall(_encode(dict(arguments, id=request_id, op=op)))
+
+        with self._response_received:
+            self._response_received.wait_for(
+                lambda: self._responses[request_id] is not None or not self.connected, self.response_timeout)
+            reply = self._responses.pop(request_id)
+
+        if reply is None:
+            raise IOError("no reply from the nanosync daemon within %s seconds" % self.response_timeout)
+        error = reply.get("error")
+        if error == "ConfigWriteError":
+            raise ConfigWriteError(reply["message"], NanoSyncConfig(reply["expected"]),
+                                   NanoSyncConfig(reply["observed"]), tuple(reply["fields"]), reply["attempts"])
+        if error == "ValueError":
+            raise ValueError(reply["message"])
+        if error is not None:
+            raise IOError("%s: %s" % (error, reply["message"]))
+        return reply
+
+    def _cached_config(self, force=False):
+        self._call("get", force=force)
+
+    def get_config(self, force=False):
+        """Returns the current NanoSyncConfig, from the daemon's cache if it is younger than its max_age"""
+
+        self._cached_config(force)
+        return self.config
+
+    def apply(self, **fields):
+        """Changes several settings in a single write made by the daemon, see NanoSync.apply"""
+
+        self._merge_fields(fields)  # raises before anything is sent if a setting is invalid
+        self._call("apply", fields=fields)
+
+    def send_new_config_raw(self, new_config):
+        """Sends a list of 20 values, or a NanoSyncConfig, to be written by the daemon
+
+        raises ValueError without anything being sent if it is not a valid config, see NanoSync.send_new_config_raw"""
+
+        self._call("raw", config=list(self._raw_config(new_config)))
+
+    def watch(self, callback=None):
+        """Returns a ConfigWatcher that reports the changes the daemon sees on the unit, see NanoSync.watch"""
+
+        if not self._watching:
+            self._call("watch")
+            self._watching = True
+        watcher = ConfigWatcher(self, poll=False)
+        if callback is not None:
+            watcher.subscribe(callback)
+        return watcher
+
+    def disconnect(self):
+        for watcher in list(self._watchers):
+            watcher.close()
+        if self.connected:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        self._socket.close()
+        self._reader.join()
+
+
+# everything else is shared with NanoSync, it only relies on _cached_config() and apply()
+for _name in ["refresh", "print_current_config", "get_current_refresh_rate", "set_refresh_rate", "transaction"] + \
+        ["set_" + _field.name for _field in FIELDS.values()]:
+    setattr(NanoSyncClient, _name, getattr(NanoSync, _name))
+
+
+def _address(text):
+    """host:port for a TCP port on that interface, anything else is a unix socket path"""
+
+    host, _, port = text.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--address", type=_address, default=DEFAULT_ADDRESS,
+                        help="unix socket path or host:port to listen on, default %s" % (DEFAULT_ADDRESS,))
+    parser.add_argument("--max-age", type=float, default=1.0,
+                        help="seconds a config read from the unit is served to clients without asking it again")
+    parser.add_argument("--timeout", type=float, default=0.5, help="seconds to wait for each reply from the unit")
+    parser.add_argument("--emulate", action="store_true", help="serve an emulated nanosyncs instead of a real one")
+    args = parser.parse_args(argv)
+
+    transport = None
+    if args.emulate:
+        from Nano_sync_emulator import EmulatedTransport
+        transport = EmulatedTransport()
+
+    daemon = NanoSyncDaemon(NanoSync(timeout=args.timeout, max_age=args.max_age, transport=transport), args.address)
+    print("serving nanosyncs %s on %s" % (daemon.nanosync.serial_number, args.address), file=sys.stderr)
+
+    thread = threading.Thread(target=daemon.serve_forever, name="nanosync daemon")
+    thread.start()
+    try:
+        thread.join()
+    except KeyboardInterrupt:
+        daemon.shutdown()
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import time
+import heapq
+import random
+import threading
+
+from Nano_sync_control import Transport, SYSEX_HEADER, SYSEX_FOOTER
+
+
+class EmulatedNanoSync:
+    """Software nanosyncs that answers the same system exclusive protocol as the real unit
+
+    command 1 is answered with the serial number and firmware version, command 3 with the 20 byte config and frames
+    starting with 0x0F replace the config. Replies can be delayed by latency +/- jitter seconds and dropped with a
+    probability of drop_rate"""
+
+    def __init__(self, serial_number="0001", firmware_version="0105", config=None,
+                 latency=0.0, jitter=0.0, drop_rate=0.0, seed=None):
+
+        self.serial_number = serial_number
+        self.firmware_version = firmware_version
+        # same defaults as NanoSync: internal ref, ntsc, 1080p x2 fps, 30 fps, all outputs HD
+        self.config = list(config) if config is not None else [0, 1, 1, 3, 5, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]
+
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def handle(self, frame):
+        """Processes a frame sent to the unit, returns the reply frame or None if there is nothing to answer"""
+
+        if len(frame) < 6 or frame[:4] != SYSEX_HEADER:
+            return None
+
+        command = frame[4]
+        with self._lock:
+            if command == 1:
+                reply = [ord(char) for char in self.serial_number + self.firmware_version]
+            elif command == 3:
+                reply = list(self.config)
+            elif command == 15 and len(frame) == 26:
+                self.config = list(frame[5:-1])
+                return None
+            else:
+                return None
+
+        if self._random.random() < self.drop_rate:
+            return None
+        return SYSEX_HEADER + [command] + reply + SYSEX_FOOTER
+
+    def reply_delay(self):
+        """Seconds before a reply reaches the host"""
+        return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+
+class EmulatedTransport(Transport):
+    """Transport that connects NanoSync to one of a list of EmulatedNanoSync units instead of a midi port
+
+    sync = NanoSync(transport=EmulatedTransport([EmulatedNanoSync(latency=0.002)]))
+
+    Each unit shows up as a port named "NANOSYNCS <n>". Several transports can share the same list of units, which is
+    how NanoSyncFleet is pointed at emulated units"""
+
+    def __init__(self, devices=None):
+
+        self.devices = devices if devices is not None else [EmulatedNanoSync()]
+        self.device = None
+        self._callback = None
+
+        # replies are delivered from one thread in order of their due time, like the rtmidi callback thread
+        self._pending = []    # heap of (due time, sequence, frame)
+        self._sequence = 0
+        self._wake = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def list_ports(self):
+        names = ["NANOSYNCS %i" % (i + 1) for i in range(len(self.devices))]
+        return names, list(names)
+
+    def open(self, in_port, out_port, callback):
+        if in_port != out_port:
+            raise IOError("emulated nanosyncs in port %i and out port %i are different units" % (in_port, out_port))
+
+        self.device = self.devices[in_port]
+        self._callback = callback
+        self._closed = False
+        self._thread = threading.Thread(target=self._deliver, name="emulated nanosyncs", daemon=True)
+        self._thread.start()
+
+    def send_frame(self, frame):
+        if self.device is None:
+            raise IOError("emulated nanosyncs port is not open")
+
+        reply = self.device.handle(list(frame))
+        if reply is not None:
+            self._schedule(self.device.reply_delay(), reply)
+
+    def _schedule(self, delay, frame):
+        """Queues a frame to be passed to the callback in delay seconds"""
+
+        with self._wake:
+            heapq.heappush(self._pending, (time.monotonic() + delay, self._sequence, frame))
+            self._sequence += 1
+            self._wake.notify()
+
+    def close(self):
+        with self._wake:
+            self._closed = True
+            self._wake.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.device = None
+        self._pending = []
+
+    def _deliver(self):
+        while True:
+            with self._wake:
+                while not self._closed and (not self._pending or self._pending[0][0] > time.monotonic()):
+                    self._wake.wait(self._pending[0][0] - time.monotonic() if self._pending else None)
+                if self._closed:
+                    return
+                due, sequence, frame = heapq.heappop(self._pending)
+            self._callback(frame)
@@ -0,0 +1,121 @@
+"""Named nanosyncs setups kept in a JSON file, recalled with a single write and recognised from the current config
+
+    presets = PresetStore("presets.json")
+    presets.add("broadcast 59.94", sync.get_config())
+    presets.save()
+
+    presets.recall(sync, "film 23.98")
+    presets.identify(sync)               # -> "film 23.98"
+
+The file maps each preset name to its settings by label, eg. {"film 23.98": {"video_ref": "internal", "fps":
+"23.98 fps", ...}}, with every setting of FIELDS given so that a preset always describes the whole unit
+"""
+import os
+import json
+
+from Nano_sync_control import NanoSyncConfig, FIELDS, encode_setting, decode_setting, check_config
+
+
+def config_fingerprint(config):
+    """Returns the key a config is recognised by - the config with the cursor position cleared, as the unit moves the
+    cursor by itself"""
+
+    if not isinstance(config, NanoSyncConfig):
+        config = NanoSyncConfig(config)
+    return config.replace(cursor_pos=0)
+
+
+class PresetStore:
+    """Named configs, validated and encoded once when they are added so a recall only sends a prebuilt frame
+
+    Presets are looked up by name, or from a config with find(), both dict lookups"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._presets = {}   # name -> NanoSyncConfig
+        self._names = {}     # config_fingerprint -> name
+
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __getitem__(self, name):
+        return self._presets[name]
+
+    def __contains__(self, name):
+        return name in self._presets
+
+    def __iter__(self):
+        return iter(self._presets)
+
+    def __len__(self):
+        return len(self._presets)
+
+    def add(self, name, config):
+        """Adds or replaces a preset, given as a NanoSyncConfig, a list of 20 values or a dict of setting labels
+
+        raises ValueError if a setting is invalid, a setting is missing or another preset has the same config"""
+
+        if isinstance(config, dict):
+            missing = [field for field in FIELDS if field not in config]
+            if missing:
+                raise ValueError("preset %s does not give %s" % (name, ", ".join(missing)))
+            config = NanoSyncConfig([0] + [encode_setting(field, config[field]) for field in FIELDS])
+        check_config(config)
+        fingerprint = config_fingerprint(config)
+
+        other = self._names.get(fingerprint)
+        if other is not None and other != name:
+            raise ValueError("preset %s has the same config as preset %s" % (name, other))
+
+        self.remove(name)
+        fingerprint.to_sysex()  # the frame is encoded now rather than on the first recall
+        self._presets[name] = fingerprint
+        self._names[fingerprint] = name
+
+    def remove(self, name):
+        config = self._presets.pop(name, None)
+        if config is not None:
+            del self._names[config]
+
+    def find(self, config):
+        """Returns the name of the preset the config matches, None if it matches none"""
+
+        return self._names.get(config_fingerprint(config))
+
+    def identify(self, nanosync, force=False):
+        """Returns the name of the preset a NanoSync is set to, None if it is set to none of them"""
+
+        return self.find(nanosync.get_config(force))
+
+    def recall(self, nanosync, name):
+        """Sets a NanoSync to a preset with a single write and read back, see NanoSync.recall"""
+
+        return nanosync.recall(self._presets[name])
+
+    def capture(self, nanosync, name):
+        """Adds the config a NanoSync is set to now as a preset"""
+
+        self.add(name, nanosync.get_config(force=True))
+
+    def load(self, path=None):
+        """Replaces the presets with the ones in a JSON file, every preset is checked before any is used"""
+
+        with open(path or self.path) as file:
+            presets = json.load(file)
+
+        store = PresetStore()
+        for name, settings in presets.items():
+            store.add(name, settings)
+        self._presets, self._names = store._presets, store._names
+
+    def save(self, path=None):
+        """Writes the presets to a JSON file, replacing it in one step so a crash can't leave half a file"""
+
+        path = path or self.path
+        presets = {name: {field.name: decode_setting(field.name, config[field.offset]) for field in FIELDS.values()}
+                   for name, config in self._presets.items()}
+
+        temporary = path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump(presets, file, indent=2)
+        os.replace(temporary, path)
@@ -0,0 +1,547 @@
+"""Tests that drive NanoSync and the tools around it through the emulated nanosyncs, no hardware is needed
+
+    python -m pytest -q
+"""
+import io
+import json
+import time
+import socket
+import threading
+from fractions import Fraction
+
+import pytest
+
+from Nano_sync_control import (NanoSync, NanoSyncConfig, NanoSyncFleet, NanoSyncMetrics, Transport, RetryPolicy, RefreshRate,
+                               REFRESH_RATES, ConfigWriteError, LinkLostError, find_nanosync_ports, refresh_rate_settings,
+                               is_valid_config, validate_configs, plan_writes)
+from Nano_sync_emulator import EmulatedNanoSync, EmulatedTransport
+
+FAST_RETRIES = RetryPolicy(max_attempts=3, backoff=0.001, jitter=0)
+
+
+class CountingNanoSync(EmulatedNanoSync):
+    """Emulated unit that counts the config writes it gets and can go quiet
+
+    the next silent replies are dropped, and so is the read back after each of the next lost_read_backs writes"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writes = 0
+        self.silent = 0
+        self.lost_read_backs = 0
+
+    def handle(self, frame):
+        if frame[4] == 15:
+            self.writes += 1
+            if self.lost_read_backs:
+                self.lost_read_backs -= 1
+                self.silent = 1
+        reply = super().handle(frame)
+        if reply is not None and self.silent:
+            self.silent -= 1
+            return None
+        return reply
+
+
+class UnpluggableTransport(EmulatedTransport):
+    """Emulated transport whose next fail_sends frames can't be sent, like a pulled usb cable"""
+
+    fail_sends = 0
+
+    def send_frame(self, frame):
+        if self.fail_sends:
+            self.fail_sends -= 1
+            raise IOError("emulated cable pulled")
+        super().send_frame(frame)
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+@pytest.fixture
+def unit():
+    return CountingNanoSync("AAAA")
+
+
+@pytest.fixture
+def sync(unit):
+    nanosync = NanoSync(timeout=0.05, transport=UnpluggableTransport([unit]), retry_policy=FAST_RETRIES)
+    yield nanosync
+    nanosync.disconnect()
+
+
+def test_connecting_to_the_emulator_reads_the_serial_number_and_config(sync, unit):
+    assert (sync.serial_number, sync.firmware_version) == ("AAAA", "01.05")
+    assert sync.config == NanoSyncConfig(unit.config)
+    assert sync.midi_in_name == sync.midi_out_name == "NANOSYNCS 1"
+
+
+def test_emulated_replies_arrive_after_the_latency_and_can_be_dropped():
+    unit = EmulatedNanoSync(latency=0.05)
+    sync = NanoSync(timeout=0.5, transport=EmulatedTransport([unit]))
+    try:
+        start = time.perf_counter()
+        sync.get_config(force=True)
+        assert time.perf_counter() - start >= 0.05
+
+        unit.drop_rate = 1.0
+        with pytest.raises(IOError):
+            sync.get_config(force=True)
+    finally:
+        sync.disconnect()
+
+
+def test_a_transport_missing_a_method_fails_when_it_is_created():
+    class Incomplete(Transport):
+        def list_ports(self):
+            return [], []
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_apply_changes_several_settings_in_one_write(sync, unit):
+    sync.apply(hd_standard="720p x2 fps", fps="25 fps")
+
+    assert unit.writes == 1
+    assert unit.config[3:5] == [5, 3]
+    assert (sync.get_hd_standard(), sync.get_fps()) == ("720p x2 fps", "25 fps")
+
+
+def test_apply_refuses_an_invalid_setting_before_sending(sync, unit):
+    with pytest.raises(ValueError):
+        sync.apply(fps="25 fps", hd_standard="1080x")
+    assert unit.writes == 0
+
+
+def test_transaction_writes_once_and_not_at_all_when_the_block_raises(sync, unit):
+    with sync.transaction() as t:
+        t.hd_standard = "720p x2 fps"
+        t.fps = "30 fps"
+    assert unit.writes == 1
+    assert unit.config[3:5] == [5, 5]
+
+    with pytest.raises(RuntimeError):
+        with sync.transaction() as t:
+            t.fps = "24 fps"
+            raise RuntimeError
+    assert unit.writes == 1
+
+
+class ShuffledTransport(EmulatedTransport):
+    """Lists the out ports of the emulated units in reverse order, as rtmidi may list them in any order"""
+
+    def list_ports(self):
+        names, _ = super().list_ports()
+        return names, names[::-1]
+
+    def open(self, in_port, out_port, callback):
+        super().open(in_port, len(self.devices) - 1 - out_port, callback)
+
+
+def test_find_nanosync_ports_pairs_ports_by_name():
+    class Listing(EmulatedTransport):
+        def list_ports(self):
+            return ["NANOSYNCS 2", "Midi Through", "NANOSYNCS 1"], ["NANOSYNCS 1", "NANOSYNCS 3", "NANOSYNCS 2"]
+
+    assert find_nanosync_ports(Listing()) == [(0, 2), (2, 0)]
+
+
+def test_nanosync_opens_the_in_and_out_port_of_the_same_unit():
+    sync = NanoSync(timeout=0.05, transport=ShuffledTransport([EmulatedNanoSync("0001"), EmulatedNanoSync("0002")]))
+    try:
+        assert (sync.midi_in_port, sync.midi_out_port) == (0, 1)
+        assert sync.serial_number == "0001"
+    finally:
+        sync.disconnect()
+
+
+def test_fleet_keeps_the_units_that_connect():
+    units = [EmulatedNanoSync("0001"), EmulatedNanoSync("0002", drop_rate=1.0)]
+    fleet = NanoSyncFleet(timeout=0.05, transport_factory=lambda: EmulatedTransport(units))
+    try:
+        assert list(fleet) == ["0001"]
+        assert list(fleet.errors) == [("NANOSYNCS 2", "NANOSYNCS 2")]
+        assert fleet.apply(fps="25 fps")["0001"].fps == 3
+    finally:
+        fleet.disconnect()
+
+
+def test_benchmark_still_reports_when_replies_are_lost(tmp_path):
+    import Nano_sync_benchmark
+
+    output = tmp_path / "results.json"
+    Nano_sync_benchmark.main(["--iterations", "20", "--duration", "0.3", "--drop-rate", "0.1", "--seed", "4",
+                              "--timeout", "0.02", "--output", str(output)])
+
+    results = json.loads(output.read_text())["results"]
+    for name in ("query", "write_and_verify", "setter", "config_change"):
+        assert results[name]["count"] + results[name]["errors"] == 20
+
+
+def test_write_behind_merges_a_burst_into_one_write(unit):
+    sync = NanoSync(timeout=0.05, transport=EmulatedTransport([unit]), write_behind=0.05)
+    try:
+        futures = [sync.set_fps("25 fps"), sync.set_hd_standard("720p x2 fps"), sync.set_fps("24 fps")]
+        sync.flush(timeout=2)
+
+        assert unit.writes == 1
+        assert unit.config[3:5] == [5, 2]
+        assert all(future.result(timeout=2) == NanoSyncConfig(unit.config) for future in futures)
+    finally:
+        sync.disconnect()
+
+
+def test_disabling_write_behind_writes_what_is_queued(unit):
+    sync = NanoSync(timeout=0.05, transport=EmulatedTransport([unit]), write_behind=10.0)
+    try:
+        queued = sync.set_fps("25 fps")
+        sync.disable_write_behind()
+
+        assert queued.done()
+        assert unit.config[4] == 3
+        sync.set_fps("24 fps")   # written straight away again
+        assert unit.config[4] == 2
+    finally:
+        sync.disconnect()
+
+
+def test_watch_callbacks_run_on_the_watcher_thread(sync, unit):
+    seen = []
+
+    def callback(changes):
+        # querying the unit from the callback has to work, the replies arrive on another thread
+        seen.append((threading.current_thread().name, changes, sync.get_config(force=True).fps))
+
+    watcher = sync.watch(callback, poll=False)
+    sync.transport._schedule(0, [240, 44, 78, 83, 3] + unit.config[:4] + [2] + unit.config[5:] + [247])
+
+    assert wait_until(lambda: seen)
+    watcher.close()
+    name, changes, fps = seen[0]
+    assert name == "nanosyncs watcher"
+    assert [change.field for change in changes] == ["fps"]
+    assert fps == unit.config[4]
+
+
+def test_watch_polls_for_changes_made_on_the_unit(sync, unit):
+    with sync.watch(min_interval=0.01, max_interval=0.02) as watcher:
+        unit.config[4] = 3   # eg. from the front panel
+        changes = next(iter(watcher))
+
+    assert [tuple(change) for change in changes] == [("fps", "30 fps", "25 fps")]
+
+
+FRAME_RATES = {1: Fraction(24000, 1001), 2: Fraction(24), 3: Fraction(25), 4: Fraction(30000, 1001), 5: Fraction(30)}
+# HD standard byte -> (frame rate multiplier, interlaced)
+HD_STANDARDS = {1: (1, True), 2: (1, False), 3: (2, False), 4: (1, False), 5: (2, False)}
+
+
+@pytest.mark.parametrize("hd_standard", sorted(HD_STANDARDS))
+@pytest.mark.parametrize("fps", sorted(FRAME_RATES))
+def test_refresh_rate_of_every_hd_standard_and_fps(hd_standard, fps):
+    multiplier, interlaced = HD_STANDARDS[hd_standard]
+    rate = FRAME_RATES[fps] * multiplier
+
+    assert REFRESH_RATES[(hd_standard, fps)] == RefreshRate(rate.numerator, rate.denominator, rate, interlaced)
+
+
+@pytest.mark.parametrize("arguments, settings", [
+    ((Fraction(60000, 1001),), ("1080p x2 fps", "29.97 fps")),
+    ((59.94,), ("1080p x2 fps", "29.97 fps")),
+    ((Fraction(24000, 1001),), ("1080p x1 fps", "23.98 fps")),
+    ((50, False, 720), ("720p x2 fps", "25 fps")),
+    ((25, True), ("1080i x2 fps", "25 fps")),
+])
+def test_refresh_rate_settings_finds_the_standard_for_a_rate(arguments, settings):
+    assert refresh_rate_settings(*arguments) == settings
+
+
+@pytest.mark.parametrize("arguments", [(100,), (59.94, True), (25, True, 720), (47,)])
+def test_refresh_rate_settings_raises_for_a_rate_no_standard_gives(arguments):
+    with pytest.raises(ValueError):
+        refresh_rate_settings(*arguments)
+
+
+def test_set_refresh_rate_writes_the_standard_and_fps_together(sync, unit):
+    sync.set_refresh_rate(50, lines=720)
+
+    assert unit.writes == 1
+    assert unit.config[3:5] == [5, 3]
+    assert sync.get_current_refresh_rate() == RefreshRate(50, 1, Fraction(50), False)
+
+
+def test_metrics_label_the_serial_number_handshake_with_the_unit():
+    metrics = NanoSyncMetrics()
+    sync = NanoSync(timeout=0.05, transport=EmulatedTransport([EmulatedNanoSync("0001")]), metrics=metrics)
+    try:
+        sync.get_config(force=True)
+    finally:
+        sync.disconnect()
+
+    snapshot = metrics.snapshot()
+    assert sorted(snapshot["frames_sent"]) == [["0001", "config_query", 2], ["0001", "serial_query", 1]]
+    assert {serial for serial, _, _ in snapshot["frames_received"]} == {"0001"}
+    assert 'serial=""' not in metrics.to_prometheus()
+
+
+def test_metrics_of_a_failed_handshake_are_labelled_with_the_port():
+    metrics = NanoSyncMetrics()
+    with pytest.raises(IOError):
+        NanoSync(timeout=0.02, transport=EmulatedTransport([EmulatedNanoSync(drop_rate=1.0)]), metrics=metrics)
+
+    assert metrics.snapshot()["timeouts"] == [["NANOSYNCS 1", "serial_query", 1]]
+
+
+def test_write_is_retried_when_the_read_back_is_lost(sync, unit):
+    unit.lost_read_backs = 1
+    sync.set_fps("25 fps")
+
+    assert unit.writes == 2
+    assert sync.get_fps() == "25 fps"
+
+
+def test_write_that_is_never_read_back_raises_config_write_error(sync, unit):
+    unit.lost_read_backs = 100
+
+    with pytest.raises(ConfigWriteError) as raised:
+        sync.set_fps("25 fps")
+    assert raised.value.attempts == 3
+    assert raised.value.fields == ("fps",)
+
+
+def test_writing_the_config_the_unit_already_has_is_skipped(unit):
+    metrics = NanoSyncMetrics()
+    sync = NanoSync(timeout=0.05, transport=EmulatedTransport([unit]), metrics=metrics)
+    try:
+        sync.apply(fps=sync.get_fps())
+        sync.send_new_config_raw(list(unit.config))
+    finally:
+        sync.disconnect()
+
+    assert unit.writes == 0
+    assert metrics.snapshot()["config_writes"] == [["AAAA", "skipped", 2]]
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs unix sockets")
+def test_daemon_serves_cached_reads_during_a_write(tmp_path):
+    from Nano_sync_daemon import NanoSyncDaemon, NanoSyncClient
+
+    unit = EmulatedNanoSync(latency=0.2)
+    daemon = NanoSyncDaemon(NanoSync(max_age=10.0, transport=EmulatedTransport([unit])), str(tmp_path / "ns.sock"))
+    thread = threading.Thread(target=daemon.serve_forever)
+    thread.start()
+    try:
+        writer, reader = NanoSyncClient(daemon.address), NanoSyncClient(daemon.address)
+        events = []
+        reader.watch(events.append)
+
+        writing = threading.Thread(target=writer.set_fps, args=("25 fps",))
+        writing.start()
+        time.sleep(0.05)
+        start = time.monotonic()
+        reader.get_config()
+        assert time.monotonic() - start < 0.1
+
+        writing.join()
+        assert wait_until(lambda: events)
+        assert [change.new for change in events[0]] == ["25 fps"]
+        writer.disconnect()
+        reader.disconnect()
+    finally:
+        daemon.shutdown()
+        thread.join()
+
+
+def test_a_recorded_session_reads_back_and_replays(tmp_path):
+    from Nano_sync_capture import RecordingTransport, ReplayTransport, read_capture, SENT, RECEIVED
+
+    path = str(tmp_path / "session.nslog")
+    sync = NanoSync(timeout=0.5, transport=RecordingTransport(EmulatedTransport([EmulatedNanoSync("0001")]), path))
+    sync.set_fps("25 fps")
+    sync.disconnect()
+
+    captured = list(read_capture(path))
+    # serial and config query on connecting, the fresh config read before the write, the write (which has no reply)
+    # and its read back
+    assert [(frame.direction, frame.frame[4]) for frame in captured] == [
+        (SENT, 1), (RECEIVED, 1), (SENT, 3), (RECEIVED, 3), (SENT, 3), (RECEIVED, 3), (SENT, 15), (SENT, 3), (RECEIVED, 3)]
+
+    replayed = NanoSync(timeout=0.5, transport=ReplayTransport(path, time_scale=0))
+    try:
+        assert replayed.serial_number == "0001"
+        replayed.set_fps("25 fps")
+        assert replayed.get_fps() == "25 fps"
+    finally:
+        replayed.disconnect()
+
+    diverging = NanoSync(timeout=0.5, transport=ReplayTransport(path, time_scale=0), retry_policy=FAST_RETRIES)
+    try:
+        with pytest.raises(IOError):
+            diverging.set_fps("24 fps")
+    finally:
+        diverging.disconnect()
+
+    with open(path, "r+b") as file:   # as if the recording crashed half way through writing the last reply
+        file.truncate(file.seek(0, 2) - 3)
+    assert list(read_capture(path)) == captured[:-1]
+
+
+def test_supervisor_reconnects_to_the_same_unit_without_reading_other_units(unit):
+    other = CountingNanoSync("BBBB", firmware_version="0299", config=[0, 1, 1, 5, 3, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1,
+                                                                       1, 1, 1])
+    sync = NanoSync(timeout=0.05, transport=EmulatedTransport([unit, other]))
+    try:
+        config, firmware_version = sync.config, sync.firmware_version
+        events = []
+        watcher = sync.watch(events.append, poll=False)
+        supervisor = sync.supervise(outage="queue", scan_interval=0.01, max_timeouts=1)
+
+        unit.drop_rate = 1.0
+        with pytest.raises(IOError):
+            sync.get_config(force=True)
+        assert supervisor.lost
+        assert wait_until(lambda: supervisor._other_units)   # the second unit has been asked and skipped
+
+        assert (sync.serial_number, sync.firmware_version, sync.config) == ("AAAA", firmware_version, config)
+        with pytest.raises(LinkLostError):
+            sync.get_config(force=True)
+
+        unit.drop_rate = 0.0
+        assert wait_until(lambda: not supervisor.lost)
+        assert sync.get_config(force=True) == NanoSyncConfig(unit.config)
+        assert supervisor.outages == 1
+        watcher.close()
+        assert events == []
+    finally:
+        sync.disconnect()
+
+
+def test_write_cut_off_by_a_lost_link_is_queued(sync, unit):
+    supervisor = sync.supervise(outage="queue", scan_interval=0.01, max_timeouts=1)
+    unit.lost_read_backs = 1   # which takes the link down
+
+    queued = sync.apply(fps="25 fps")
+
+    assert queued is not None
+    assert queued.result(timeout=2).fps == 3
+    assert unit.config[4] == 3
+    assert supervisor.outages == 1
+
+
+def test_failed_send_takes_the_link_down_straight_away(sync, unit):
+    supervisor = sync.supervise(outage="reject", scan_interval=0.01, max_timeouts=10)
+    sync.transport.fail_sends = 1
+
+    with pytest.raises(LinkLostError):
+        sync.set_fps("25 fps")
+    assert supervisor.outages == 1
+
+    assert wait_until(lambda: not supervisor.lost)
+    sync.set_fps("25 fps")
+    assert unit.config[4] == 3
+
+
+class ClockedNanoSync(EmulatedNanoSync):
+    """Emulated unit that notes the time.monotonic() each config write was applied"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.applied = []
+
+    def handle(self, frame):
+        if frame[4] == 15:
+            self.applied.append(time.monotonic())
+        return super().handle(frame)
+
+
+def test_scheduled_change_lands_at_its_deadline_despite_the_latency():
+    unit = ClockedNanoSync(latency=0.03)
+    sync = NanoSync(timeout=0.5, transport=EmulatedTransport([unit]))
+    try:
+        sync.set_fps("25 fps")   # a write to estimate the landing delay from
+
+        cue = time.monotonic() + 0.2
+        report = sync.schedule_apply({"fps": "24 fps"}, at=cue).result(timeout=2)
+    finally:
+        sync.disconnect()
+
+    # the emulated write is applied as it is sent and only the replies are delayed, so with half of the read back
+    # round trip taken as the landing delay it would land 15 ms early
+    assert abs(unit.applied[-1] - cue) < 0.01
+    assert abs(report.landed - unit.applied[-1]) < 0.01
+    assert abs(report.error) < 0.01
+    assert report.config.fps == 2
+
+
+def test_invalid_settings_and_configs_are_refused_before_sending(sync, unit):
+    with pytest.raises(ValueError):
+        sync.apply(fps="26 fps")
+    with pytest.raises(ValueError):
+        sync.send_new_config_raw(tuple(unit.config))
+    with pytest.raises(ValueError):
+        sync.send_new_config_raw(unit.config[:19])
+    with pytest.raises(ValueError):
+        sync.send_new_config_raw(unit.config[:17] + [5] + unit.config[18:])  # word mult 7 to 8 goes up to 4
+    assert unit.writes == 0
+
+
+def test_word_multiplier_7_8_bytes_match_the_byte_map():
+    config = [0, 1, 1, 3, 5, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]
+    assert [is_valid_config(config[:17] + [value] + config[18:]) for value in range(6)] == \
+        [False, True, True, True, True, False]
+
+
+def test_validate_configs_reports_only_the_invalid_ones():
+    valid = [0, 1, 1, 3, 5, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]
+    errors = validate_configs([valid, valid[:4] + [9] + valid[5:], valid[:19]])
+
+    assert sorted(errors) == [1, 2]
+    assert errors[1] == ["fps can't be 9, expected one of [1, 2, 3, 4, 5]"]
+
+
+def test_plan_writes_skips_targets_that_change_nothing():
+    current = NanoSyncConfig([7, 1, 1, 3, 5, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1])
+    same_but_the_cursor = [0] + list(current)[1:]
+
+    writes = plan_writes(current, {"fps": "30 fps"}, same_but_the_cursor, {"fps": "25 fps"}, {"fps": "25 fps"})
+
+    assert [(write.cursor_pos, write.fps) for write in writes] == [(7, 3)]
+    with pytest.raises(ValueError):
+        plan_writes(current, {"fps": "25 fps"}, list(current)[:19])
+
+
+def test_batch_reports_malformed_operations_and_keeps_going(sync, unit):
+    import Nano_sync_batch
+
+    script = ['{"fields": {"fps": "25 fps"}}', '{"op": "apply"}', 'apply fps="24 fps"', 'assert fps="24 fps"']
+    output = io.StringIO()
+
+    assert not Nano_sync_batch.run(sync, script, output, keep_going=True)
+
+    reports = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [(report["lines"], report["ok"]) for report in reports] == [([1], False), ([2], False), ([3], True),
+                                                                        ([4], True)]
+    assert unit.config[4] == 2
+
+
+def test_batch_merges_consecutive_applies_and_stops_at_a_failed_assert(sync, unit):
+    import Nano_sync_batch
+
+    script = ['apply hd_standard="720p x2 fps"', '# a comment', 'apply fps="25 fps"', 'assert fps="24 fps"',
+              'apply fps="30 fps"']
+    output = io.StringIO()
+
+    assert not Nano_sync_batch.run(sync, script, output)
+
+    reports = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [(report["lines"], report["op"], report["ok"]) for report in reports] == [([1, 3], "apply", True),
+                                                                                      ([4], "assert", False)]
+    assert unit.writes == 1
+    assert unit.config[3:5] == [5, 3]